@@ -13,3 +13,59 @@
 # MONGO_DBNAME="somename"
 #
 # VERBOSITY="DEBUG"
+#
+# SPARSE_PASSTHROUGH=True
+# SPLICE_LINKS=True
+# VALIDATION_SCHEMA="/path/to/schemas.json"
+# JSON_ENGINE="orjson"
+#
+# COMPRESSION=True
+# COMPRESSION_ENCODINGS="zstd,br,gzip"
+# COMPRESSION_MIN_SIZE=500
+# COMPRESSION_LEVEL=6
+#
+# CONDITIONAL_GETS=True
+# HYDRATION_LIMIT=1000
+# STREAM_THRESHOLD=10000
+#
+# RECORD_CACHE_SIZE=67108864
+# LINK_CACHE_SIZE=67108864
+# CACHE_TTL=60
+# SHARED_CACHE_PATH="/dev/shm/qremis_api_cache"
+# SHARED_CACHE_SIZE=268435456
+# SHARED_CACHE_SLOT_SIZE=4096
+# LIST_CACHE_SIZE=16777216
+#
+# BLOOM_FILTER=True
+# BLOOM_FILTER_PATH="/dev/shm/qremis_api_bloom"
+# BLOOM_FILTER_CAPACITY=10000000
+# BLOOM_FILTER_ERROR_RATE=0.01
+# BLOOM_FILTER_RECHECK_INTERVAL=1
+# BLOOM_FILTER_REBUILD_INTERVAL=60
+#
+# SINGLE_FLIGHT=True
+#
+# ACCESS_SUMMARY_PATH="/var/lib/qremis_api/access_summary.json"
+# WARM_UP=True
+# WARM_UP_IDS="/path/to/ids.txt"
+# WARM_UP_SECONDS=30
+# WARM_UP_MAX_SIZE=67108864
+#
+# LINK_WRITE_COALESCING=True
+# LINK_WRITE_WINDOW=0.002
+# LINK_WRITE_BATCH_SIZE=100
+#
+# INGEST_QUEUE_PATH="/var/lib/qremis_api/ingest.db"
+# INGEST_WORKERS=1
+# INGEST_BATCH_SIZE=100
+# INGEST_MAX_ATTEMPTS=5
+#
+# ADMISSION_READS=64
+# ADMISSION_WRITES=8
+# ADMISSION_BULK=4
+# ADMISSION_HYDRATIONS=16
+# ADMISSION_TIMEOUT=1
+#
+# BACKEND_TIMEOUT=2
+# BACKEND_POLICY=True
+# BREAKER_THRESHOLD=5
@@ -0,0 +1,296 @@
+"""
+An ASGI variant of the API
+
+The hot read paths, full and sparse record GETs, are served natively
+from async storage backends (redis.asyncio or motor), with all of a
+full record's links fetched concurrently. Native responses are the
+stored JSON, with links spliced in, so they are only served when the
+Flask app would serve the same bytes (SPLICE_LINKS for full records,
+SPARSE_PASSTHROUGH for sparse ones). Every other request, and any
+request needing a feature only the Flask app implements (conditional
+GETs, compression, streaming, admission control, the access summary,
+any storage backend wrapper, eg: caches or the Bloom filter, non JSON
+representations, errors), is handed to the Flask app, so the routes
+and the responses are the same.
+
+Run it with any ASGI server, eg:
+
+    $ uvicorn qremis_api.asgi:app
+"""
+import asyncio
+import re
+from abc import ABCMeta, abstractmethod
+from urllib.parse import quote
+
+from pymongo import ASCENDING
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+from . import app as wsgi_app
+from .blueprint import API, BLUEPRINT, ConfigError, MongoStorageBackend, \
+    RedisStorageBackend, kind_table, linking_field, record_kinds, splice_links
+
+
+class AsyncStorageBackend(metaclass=ABCMeta):
+    """
+    ABC for async storage backends
+
+    Only the reads the natively served routes need are required. They
+    read the same keys/collections as the matching StorageBackend.
+    """
+    @abstractmethod
+    async def get_record(self, id):
+        """
+        Retrieves a record
+
+        __Args__
+
+        1. id (str): The identifier of the record to retrieve
+
+        __Returns__
+
+        * (str/None): The record, as a JSON str, or None if it does not exist
+        """
+        pass
+
+    @abstractmethod
+    async def get_kind_links(self, kind, id, limit):
+        """
+        Returns the linked${kind} identifiers of a record, in the order
+        StorageBackend.get_kind_links_many() returns them in
+
+        __Args__
+
+        1. kind (str): The kind of linked records to retrieve
+        2. id (str): The identifier of the "originating" record to examine
+        3. limit (int/None): The most identifiers to return, or None for all
+
+        __Returns__
+
+        * ([str]): The linked identifiers
+        """
+        pass
+
+    @abstractmethod
+    async def count_kind_links(self, kind, id):
+        """
+        Counts the linked${kind} records of a record
+
+        __Args__
+
+        1. kind (str): The kind of linked records to count
+        2. id (str): The identifier of the "originating" record to examine
+
+        __Returns__
+
+        * (int): The number of linked ${kind} records
+        """
+        pass
+
+
+class AsyncRedisStorageBackend(AsyncStorageBackend):
+    def __init__(self, bp):
+        if aioredis is None:
+            raise ConfigError("The redis package is too old to provide redis.asyncio")
+        RedisStorageBackend.validate_bp(bp)
+        self.redis = aioredis.StrictRedis(
+            host=bp.config['REDIS_HOST'],
+            port=bp.config.get("REDIS_PORT", 6379),
+            db=bp.config.get("REDIS_DB"),
+            socket_timeout=bp.config.get("BACKEND_TIMEOUT"),
+            socket_connect_timeout=bp.config.get("BACKEND_TIMEOUT")
+        )
+
+    async def get_record(self, id):
+        rec = await self.redis.get(id)
+        if rec is None:
+            return None
+        return rec.decode("utf-8")
+
+    async def get_kind_links(self, kind, id, limit):
+        if kind not in record_kinds:
+            raise AssertionError()
+        end = limit - 1 if limit is not None else -1
+        return [x.decode("utf-8") for x in await self.redis.zrange(id+"_"+kind+"Links", 0, end)]
+
+    async def count_kind_links(self, kind, id):
+        if kind not in record_kinds:
+            raise AssertionError()
+        return await self.redis.zcard(id+"_"+kind+"Links")
+
+
+class AsyncMongoStorageBackend(AsyncStorageBackend):
+    def __init__(self, bp):
+        if AsyncIOMotorClient is None:
+            raise ConfigError("The mongo ASGI backend requires the motor package")
+        MongoStorageBackend.validate_bp(bp)
+        timeouts = {}
+        if bp.config.get("BACKEND_TIMEOUT"):
+            timeouts = {x: int(bp.config["BACKEND_TIMEOUT"] * 1000) for x in
+                        ["socketTimeoutMS", "connectTimeoutMS", "serverSelectionTimeoutMS"]}
+        self.client = AsyncIOMotorClient(bp.config['MONGO_HOST'], bp.config.get('MONGO_PORT', 27017),
+                                         **timeouts)
+        self.db = self.client[bp.config['MONGO_DBNAME']]
+
+    async def get_record(self, id):
+        rec = await self.db['records'].find_one({'_id': id})
+        if rec is None:
+            return None
+        return rec['rec']
+
+    async def get_kind_links(self, kind, id, limit):
+        cursor = self.db[id+'Linked'+kind].find().sort('_id', ASCENDING)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return [x['_id'] for x in await cursor.to_list(None)]
+
+    async def count_kind_links(self, kind, id):
+        return await self.db[id+'Linked'+kind].estimated_document_count()
+
+
+async_storage_backends = {
+    'redis': AsyncRedisStorageBackend,
+    'mongo': AsyncMongoStorageBackend
+}
+
+
+class QremisASGI:
+    """
+    The ASGI application
+
+    __Args__
+
+    1. wsgi_app (flask.Flask): The Flask app serving everything which
+        isn't served natively
+    2. bp (flask.Blueprint): The blueprint holding the configuration
+    """
+    record_path = re.compile(r"^/(" + "|".join(record_kinds) + r")_list/([^/]+)(/sparse)?$")
+    # Configuration only the Flask app honours: conditional GETs, compression,
+    # admission control and the access summary. Storage backend wrappers
+    # are caught by route() checking the configured backend instead.
+    flask_only = ["CONDITIONAL_GETS", "COMPRESSION", "admission", "ACCESS_SUMMARY_PATH"]
+
+    def __init__(self, wsgi_app, bp=BLUEPRINT):
+        if WsgiToAsgi is None:
+            raise ConfigError("The ASGI app requires the asgiref package")
+        self.fallback = WsgiToAsgi(wsgi_app)
+        self.bp = bp
+        self.storage = None
+
+    def get_storage(self):
+        # Built on first use, so the clients belong to the server's event loop
+        if self.storage is None:
+            name = self.bp.config.get('STORAGE_BACKEND')
+            if name not in async_storage_backends:
+                raise ConfigError(
+                    "Invalid storage backend! Valid options: {}".format(
+                        ", ".join([x for x in async_storage_backends.keys()])
+                    )
+                )
+            self.storage = async_storage_backends[name](self.bp)
+        return self.storage
+
+    def route(self, scope):
+        """
+        Determines whether a request can be served natively
+
+        __Args__
+
+        1. scope (dict): The ASGI connection scope
+
+        __Returns__
+
+        * (re.Match/None): The match of the record path, or None if the
+            request should be handed to the Flask app
+        """
+        if scope['type'] != "http" or scope['method'] != "GET":
+            return None
+        if any(self.bp.config.get(x) for x in self.flask_only) or \
+                self.bp.config.get("STREAM_THRESHOLD") is not None:
+            return None
+        # Anything wrapping the backend (caches, the Bloom filter, single
+        # flight, the retry policy...) would be skipped by a native read
+        if not isinstance(self.bp.config.get('storage'), (RedisStorageBackend, MongoStorageBackend)):
+            return None
+        accept = MIMEAccept()
+        for name, value in scope['headers']:
+            if name == b"accept":
+                accept = parse_accept_header(value.decode("latin-1"), MIMEAccept)
+        if accept.best_match(API.representations, default=API.default_mediatype) != \
+                "application/json":
+            return None
+        path = scope['path']
+        root_path = scope.get('root_path', "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        match = self.record_path.match(path)
+        # Otherwise the Flask app round trips the record through pyqremis
+        if match is None or \
+                not self.bp.config.get("SPARSE_PASSTHROUGH" if match.group(3) else "SPLICE_LINKS"):
+            return None
+        return match
+
+    async def get_full(self, kind, id, root_path):
+        storage = self.get_storage()
+        limit = self.bp.config.get("HYDRATION_LIMIT") or None
+        rec_str, *links = await asyncio.gather(
+            storage.get_record(id),
+            *[storage.get_kind_links(x, id, limit) for x in kind.links]
+        )
+        if rec_str is None:
+            return None
+        links = list(zip(kind.links, links))
+        full = [x for x, ids in links if limit is not None and len(ids) >= limit]
+        totals = await asyncio.gather(*[storage.count_kind_links(x, id) for x in full])
+        truncated = {}
+        for x, total in zip(full, totals):
+            if total > limit:
+                truncated[linking_field(x)] = {
+                    "embedded": limit,
+                    "total": total,
+                    "_link": root_path + kind.path + "/" + quote(id, safe="") +
+                    "/linked" + kind_table[x].plural
+                }
+        return splice_links(rec_str, links, {"_truncated": truncated} if truncated else None)
+
+    async def __call__(self, scope, receive, send):
+        match = self.route(scope)
+        if match is None:
+            return await self.fallback(scope, receive, send)
+        kind, id, sparse = kind_table[match.group(1)], match.group(2), match.group(3)
+        if sparse:
+            body = await self.get_storage().get_record(id)
+        else:
+            body = await self.get_full(kind, id, scope.get('root_path', ""))
+        if body is None:
+            # Let the Flask app produce the error response
+            return await self.fallback(scope, receive, send)
+        body = body.encode("utf-8")
+        await send({
+            'type': "http.response.start",
+            'status': 200,
+            'headers': [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"vary", b"Accept")
+            ]
+        })
+        await send({'type': "http.response.body", 'body': body})
+
+
+app = QremisASGI(wsgi_app)
@@ -1,15 +1,68 @@
+import atexit
+import fcntl
 import logging
+import math
+import mmap
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
 from json import dumps, loads
+from hashlib import blake2b
+from itertools import islice
+from collections import OrderedDict
+from contextlib import contextmanager
 from abc import ABCMeta, abstractmethod
 
-from flask import Blueprint, jsonify
-from flask_restful import Resource, Api, reqparse
+from flask import Blueprint, Response, current_app, g, jsonify, make_response, request
+from flask_restful import Resource, Api, reqparse, inputs
+from flask_restful.representations.json import output_json as restful_output_json
+from werkzeug.http import quote_etag
 import redis
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import DuplicateKeyError
+from pymongo import MongoClient, ASCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
 
 import pyqremis
 
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 __version__ = "0.0.2"
 
@@ -25,9 +78,25 @@ log = logging.getLogger(__name__)
 
 record_kinds = ["object", "event", "agent", "rights", "relationship"]
 
+# The kinds of records each kind of record may link to, in the order
+# their linking fields appear in a hydrated record.
+record_links = {
+    "object": ["relationship"],
+    "event": ["relationship"],
+    "agent": ["relationship"],
+    "rights": ["relationship"],
+    "relationship": ["object", "agent", "event", "rights"]
+}
+
 pagination_args_parser = reqparse.RequestParser()
 pagination_args_parser.add_argument('cursor', type=str, default="0")
 pagination_args_parser.add_argument('limit', type=int, default=1000)
+pagination_args_parser.add_argument('expand', type=str, default=None)
+pagination_args_parser.add_argument('compact', type=inputs.boolean, default=False)
+pagination_args_parser.add_argument('total', type=inputs.boolean, default=False)
+
+# Identifiers made up only of these characters are never escaped in URLs
+unreserved_id_pattern = re.compile(r"^[A-Za-z0-9_.~-]+$")
 
 
 class Error(Exception):
@@ -59,11 +128,25 @@ class ServerError(Error):
     status_code = 500
 
 
+class ServiceUnavailableError(ServerError):
+    error_name = "ServiceUnavailableError"
+    status_code = 503
+
+    def __init__(self, message=None, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 class NotFoundError(Error):
     error_name = "NotFoundError"
     status_code = 404
 
 
+class ConflictError(UserError):
+    error_name = "ConflictError"
+    status_code = 409
+
+
 class DuplicateIdentifierError(UserError):
     error_name = "DuplicateIdentifierError"
 
@@ -83,8 +166,14 @@ class MissingQremisUUIDIdentifierError(InvalidQremisRecordError):
 
 @BLUEPRINT.errorhandler(Error)
 def handle_errors(error):
-    response = jsonify(error.to_dict())
-    response.status_code = error.status_code
+    if negotiated_mediatype() == "application/json":
+        response = jsonify(error.to_dict())
+        response.status_code = error.status_code
+    else:
+        response = API.make_response(error.to_dict(), error.status_code)
+    response.vary.add("Accept")
+    if getattr(error, "retry_after", None) is not None:
+        response.headers["Retry-After"] = str(error.retry_after)
     return response
 
 
@@ -136,6 +225,20 @@ class StorageBackend(metaclass=ABCMeta):
         # when required.
         pass
 
+    def link_records_many(self, links):
+        """
+        Links several pairs of records together
+
+        Backends should override this with a batched write where possible.
+
+        __Args__
+
+        1. links ([(str, str, str, str)]): The (kind1, id1, kind2, id2)
+            arguments of a link_records() call, for each link to make
+        """
+        for kind1, id1, kind2, id2 in links:
+            self.link_records(kind1, id1, kind2, id2)
+
     @abstractmethod
     def get_record(self, id):
         """
@@ -156,6 +259,70 @@ class StorageBackend(metaclass=ABCMeta):
         # else in the storage implementation go with that.
         pass
 
+    def get_records(self, ids):
+        """
+        Retrieves several records at once
+
+        Backends should override this with a batched read where possible.
+
+        __Args__
+
+        1. ids ([str]): The identifiers of the records to retrieve
+
+        __Returns__
+
+        * ([str/None]): The records as JSON strs, in the order of ids,
+            with None in place of any record which does not exist
+        """
+        results = []
+        for id in ids:
+            try:
+                results.append(self.get_record(id))
+            except IdentifierDoesNotExistError:
+                results.append(None)
+        return results
+
+    def get_kind_links_many(self, kind, ids, limit=None):
+        """
+        Returns the linked${kind} identifiers of several records at once
+
+        Backends should override this with a batched read where possible,
+        which only fetches up to limit identifiers per record.
+
+        __Args__
+
+        1. kind (str): The kind of linked records to retrieve
+        2. ids ([str]): The identifiers of the "originating" records to examine
+        3. limit (int/None): The most identifiers to return per record.
+            If None is supplied _all_ of the linked identifiers are returned.
+
+        __Returns__
+
+        * ({str: [str]}): The linked identifiers, keyed by originating identifier
+        """
+        return {id: self.get_kind_links(kind, id, "0", None)[1][:limit] for id in ids}
+
+    @abstractmethod
+    def replace_record(self, kind, id, old, new):
+        """
+        Atomically replaces a record, if it has not changed since it was read
+
+        Replacing a record increments its generation (see get_generation())
+
+        __Args__
+
+        1. kind (str): The kind of record (see module record_kinds)
+        2. id (str): The identifier of the record to replace
+        3. old (str): The JSON str the record was read as
+        4. new (str): The JSON str to replace it with
+
+        __Returns__
+
+        * (bool): Whether or not the record was replaced. False means the
+            stored record no longer matches old.
+        """
+        pass
+
     @abstractmethod
     def get_kind_links(self, kind, id, cursor, limit):
         """
@@ -176,6 +343,83 @@ class StorageBackend(metaclass=ABCMeta):
         """
         pass
 
+    def iter_kind_links(self, kind, id, batch_size=1000):
+        """
+        Iterates over _all_ of the linked${kind} identifiers of a record,
+        fetching them from the backend a batch at a time
+
+        The identifiers come in the same order get_kind_links_many() returns
+        them in. Backends should override this with a cursor over their
+        native ordering where possible.
+
+        __Args__
+
+        1. kind (str): The kind of linked records to retrieve
+        2. id (str): The identifier of the "originating" record to examine
+        3. batch_size (int): How many identifiers to fetch per round trip
+
+        __Returns__
+
+        * (iter): The linked identifiers
+        """
+        for x in self.get_kind_links_many(kind, [id])[id]:
+            yield x
+
+    @abstractmethod
+    def get_generation(self, id):
+        """
+        Returns the link generation of a record
+
+        The generation is 0 for an identifier which was never stored. It
+        is incremented when add_record() stores the record, and every time
+        link_records() or replace_record() touches it, so it changes
+        whenever any view of the record changes.
+
+        __Args__
+
+        1. id (str): The identifier of the record
+
+        __Returns__
+
+        * (int): The record's current generation
+        """
+        pass
+
+    def get_generations(self, ids):
+        """
+        Returns the link generations of several records at once
+
+        Backends should override this with a batched read where possible.
+
+        __Args__
+
+        1. ids ([str]): The identifiers of the records
+
+        __Returns__
+
+        * ([int]): The generation of each record, in the order of ids
+        """
+        return [self.get_generation(x) for x in ids]
+
+    @abstractmethod
+    def get_kind_generation(self, kind):
+        """
+        Returns the generation of a kind of record
+
+        The generation starts at 0 and is incremented every time
+        add_record() adds a record of the kind, so it changes whenever
+        the kind's listing changes.
+
+        __Args__
+
+        1. kind (str): The kind of record (see module record_kinds)
+
+        __Returns__
+
+        * (int): The kind's current generation
+        """
+        pass
+
     @abstractmethod
     def get_kind_list(self, kind, cursor, limit):
         """
@@ -194,6 +438,47 @@ class StorageBackend(metaclass=ABCMeta):
         """
         pass
 
+    @abstractmethod
+    def count_kind(self, kind):
+        """
+        Counts the ${kind} records in the system, without listing them
+
+        __Args__
+
+        1. kind (str): The kind of record to count
+
+        __Returns__
+
+        * (int): The number of ${kind} records
+        """
+        pass
+
+    @abstractmethod
+    def count_kind_links(self, kind, id):
+        """
+        Counts the linked${kind} records of a record, without listing them
+
+        __Args__
+
+        1. kind (str): The kind of linked records to count
+        2. id (str): The identifier of the "originating" record to examine
+
+        __Returns__
+
+        * (int): The number of linked ${kind} records
+        """
+        pass
+
+    def stats(self):
+        """
+        Returns operational statistics about the backend, for /stats
+
+        __Returns__
+
+        * (dict): The statistics, keyed by subsystem
+        """
+        return {}
+
 
 class RedisStorageBackend(StorageBackend):
     @staticmethod
@@ -209,7 +494,9 @@ class RedisStorageBackend(StorageBackend):
         self.redis = redis.StrictRedis(
             host=bp.config['REDIS_HOST'],
             port=bp.config.get("REDIS_PORT", 6379),
-            db=bp.config.get("REDIS_DB")
+            db=bp.config.get("REDIS_DB"),
+            socket_timeout=bp.config.get("BACKEND_TIMEOUT"),
+            socket_connect_timeout=bp.config.get("BACKEND_TIMEOUT")
         )
 
     def record_exists(self, kind, id):
@@ -221,11 +508,13 @@ class RedisStorageBackend(StorageBackend):
     def add_record(self, kind, id, rec):
         if kind not in record_kinds:
             raise AssertionError()
-        if self.record_exists(kind, id):
-            raise DuplicateIdentifierError("Identifier {} already exists".format(str(id)))
         log.debug("Adding {} record with id {}".format(kind, id))
-        self.redis.setnx(id, rec)
-        self.redis.zadd(kind+"List", 0, id)
+        # SETNX doubles as the existence check, saving a round trip
+        if not self.redis.setnx(id, rec):
+            raise DuplicateIdentifierError("Identifier {} already exists".format(str(id)))
+        self.redis.zadd(kind+"List", {id: 0})
+        self.redis.incr(id+"_generation")
+        self.redis.incr(kind+"List_generation")
 
     def link_records(self, kind1, id1, kind2, id2):
         if kind1 not in record_kinds or kind2 not in record_kinds:
@@ -261,11 +550,48 @@ class RedisStorageBackend(StorageBackend):
 #                relationshipNote="Automatically created to facilitate linking"
 #            )
 #            self.add_record(kind2, id2, dumps(relationship_record.to_dict()))
-        self.redis.zadd(id1+"_"+kind2+"Links", 0, id2)
-        self.redis.zadd(id2+"_"+kind1+"Links", 0, id1)
+        self.redis.zadd(id1+"_"+kind2+"Links", {id2: 0})
+        self.redis.zadd(id2+"_"+kind1+"Links", {id1: 0})
+        self.redis.incr(id1+"_generation")
+        self.redis.incr(id2+"_generation")
 #        if kind3 is not None and id3 is not None:
-#            self.redis.zadd(id2+"_"+kind3+"Links", 0, id3)
-#            self.redis.zadd(id3+"_"+kind2+"Links", 0, id2)
+#            self.redis.zadd(id2+"_"+kind3+"Links", {id3: 0})
+#            self.redis.zadd(id3+"_"+kind2+"Links", {id2: 0})
+
+    def link_records_many(self, links):
+        for kind1, id1, kind2, id2 in links:
+            if kind1 not in record_kinds or kind2 not in record_kinds:
+                raise AssertionError()
+            if kind1 == "relationship" and kind2 != "relationship":
+                raise AssertionError("link_records_many() takes the relationship as the " +
+                                     "second record of each link")
+        log.debug("Linking {} pairs of records".format(len(links)))
+        # One round trip for the lot. Every command is idempotent but the
+        # generation increments, which only need to move forwards.
+        with self.redis.pipeline(transaction=False) as pipe:
+            for kind1, id1, kind2, id2 in links:
+                pipe.zadd(id1+"_"+kind2+"Links", {id2: 0})
+                pipe.zadd(id2+"_"+kind1+"Links", {id1: 0})
+                pipe.incr(id1+"_generation")
+                pipe.incr(id2+"_generation")
+            pipe.execute()
+
+    def replace_record(self, kind, id, old, new):
+        if kind not in record_kinds:
+            raise AssertionError()
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(id)
+                current = pipe.get(id)
+                if current is None or current.decode("utf-8") != old:
+                    return False
+                pipe.multi()
+                pipe.set(id, new)
+                pipe.incr(id+"_generation")
+                pipe.execute()
+            except redis.WatchError:
+                return False
+        return True
 
     def get_record(self, id):
         try:
@@ -273,6 +599,50 @@ class RedisStorageBackend(StorageBackend):
         except:
             raise IdentifierDoesNotExistError(str(id))
 
+    def get_records(self, ids):
+        if not ids:
+            return []
+        return [x.decode("utf-8") if x is not None else None for x in self.redis.mget(ids)]
+
+    def get_kind_links_many(self, kind, ids, limit=None):
+        if kind not in record_kinds:
+            raise AssertionError()
+        end = limit - 1 if limit is not None else -1
+        pipe = self.redis.pipeline(transaction=False)
+        for id in ids:
+            pipe.zrange(id+"_"+kind+"Links", 0, end)
+        return {id: [x.decode("utf-8") for x in links]
+                for id, links in zip(ids, pipe.execute())}
+
+    def iter_kind_links(self, kind, id, batch_size=1000):
+        if kind not in record_kinds:
+            raise AssertionError()
+        # Every member has a score of 0, so lexicographical order is
+        # ZRANGE order, and resuming after the last member seen is stable
+        # while new links are being added.
+        start = "-"
+        while True:
+            batch = self.redis.zrangebylex(id+"_"+kind+"Links", start, "+",
+                                           start=0, num=batch_size)
+            for x in batch:
+                yield x.decode("utf-8")
+            if len(batch) < batch_size:
+                return
+            start = b"(" + batch[-1]
+
+    def get_generation(self, id):
+        return int(self.redis.get(id+"_generation") or 0)
+
+    def get_generations(self, ids):
+        if not ids:
+            return []
+        return [int(x or 0) for x in self.redis.mget([x+"_generation" for x in ids])]
+
+    def get_kind_generation(self, kind):
+        if kind not in record_kinds:
+            raise AssertionError()
+        return int(self.redis.get(kind+"List_generation") or 0)
+
     def get_kind_links(self, kind, id, cursor, limit):
         # This is kind of like a non-generator version of zscan_iter, bounded
         # at the given limit (if a limit is set)
@@ -306,6 +676,16 @@ class RedisStorageBackend(StorageBackend):
                 results.append(item)
         return cursor, [x[0].decode("utf-8") for x in results]
 
+    def count_kind(self, kind):
+        if kind not in record_kinds:
+            raise AssertionError()
+        return self.redis.zcard(kind+"List")
+
+    def count_kind_links(self, kind, id):
+        if kind not in record_kinds:
+            raise AssertionError()
+        return self.redis.zcard(id+"_"+kind+"Links")
+
 
 class MongoStorageBackend(StorageBackend):
     @staticmethod
@@ -321,7 +701,12 @@ class MongoStorageBackend(StorageBackend):
 
     def __init__(self, bp):
         self.validate_bp(bp)
-        self.client = MongoClient(bp.config['MONGO_HOST'], bp.config.get('MONGO_PORT', 27017))
+        timeouts = {}
+        if bp.config.get("BACKEND_TIMEOUT"):
+            timeouts = {x: int(bp.config["BACKEND_TIMEOUT"] * 1000) for x in
+                        ["socketTimeoutMS", "connectTimeoutMS", "serverSelectionTimeoutMS"]}
+        self.client = MongoClient(bp.config['MONGO_HOST'], bp.config.get('MONGO_PORT', 27017),
+                                  **timeouts)
         self.db = self.client[bp.config['MONGO_DBNAME']]
 
     def record_exists(self, kind, id):
@@ -331,6 +716,9 @@ class MongoStorageBackend(StorageBackend):
         try:
             self.db['records'].insert_one({'_id': id, 'rec': rec})
             self.db[kind+'List'].insert_one({'_id': id})
+            self.db['generations'].update_one({'_id': id}, {'$inc': {'generation': 1}}, upsert=True)
+            self.db['generations'].update_one({'_id': kind+'List'}, {'$inc': {'generation': 1}},
+                                              upsert=True)
         except DuplicateKeyError:
             raise DuplicateIdentifierError("Identifier {} already exists".format(str(id)))
 
@@ -365,16 +753,86 @@ class MongoStorageBackend(StorageBackend):
 #            self.add_record(kind2, id2, dumps(relationship_record.to_dict()))
         self.db[id1+'Linked'+kind2].insert_one({'_id': id2})
         self.db[id2+'Linked'+kind1].insert_one({'_id': id1})
+        self.db['generations'].update_one({'_id': id1}, {'$inc': {'generation': 1}}, upsert=True)
+        self.db['generations'].update_one({'_id': id2}, {'$inc': {'generation': 1}}, upsert=True)
 #        if kind3 is not None and id3 is not None:
 #            self.db[id2+'Linked'+kind3].insert_one({'_id': id3})
 #            self.db[id3+'Linked'+kind2].insert_one({'_id': id2})
 
+    def link_records_many(self, links):
+        for kind1, id1, kind2, id2 in links:
+            if kind1 not in record_kinds or kind2 not in record_kinds:
+                raise AssertionError()
+            if kind1 == "relationship" and kind2 != "relationship":
+                raise AssertionError("link_records_many() takes the relationship as the " +
+                                     "second record of each link")
+        log.debug("Linking {} pairs of records".format(len(links)))
+        # Links live in a collection per record, so there is a bulk write
+        # per collection, and one for all of the generations. Upserts keep
+        # relinking harmless, as it is for the redis backend.
+        writes = OrderedDict()
+        generations = OrderedDict()
+        for kind1, id1, kind2, id2 in links:
+            writes.setdefault(id1+'Linked'+kind2, []).append(ReplaceOne({'_id': id2}, {'_id': id2},
+                                                                        upsert=True))
+            writes.setdefault(id2+'Linked'+kind1, []).append(ReplaceOne({'_id': id1}, {'_id': id1},
+                                                                        upsert=True))
+            generations[id1] = generations.get(id1, 0) + 1
+            generations[id2] = generations.get(id2, 0) + 1
+        for collection, requests in writes.items():
+            self.db[collection].bulk_write(requests, ordered=False)
+        if generations:
+            self.db['generations'].bulk_write(
+                [UpdateOne({'_id': x}, {'$inc': {'generation': n}}, upsert=True)
+                 for x, n in generations.items()],
+                ordered=False
+            )
+
+    def replace_record(self, kind, id, old, new):
+        # Matching on the old record makes this a compare and swap. The
+        # generation moves after the record, so a reader between the two
+        # writes may get the new record under the old generation, but
+        # never the old record under the new one.
+        result = self.db['records'].update_one({'_id': id, 'rec': old}, {'$set': {'rec': new}})
+        if result.matched_count == 0:
+            return False
+        self.db['generations'].update_one({'_id': id}, {'$inc': {'generation': 1}}, upsert=True)
+        return True
+
     def get_record(self, id):
         rec = self.db['records'].find_one({'_id': id})
         if rec is None:
             raise IdentifierDoesNotExistError(str(id))
         return rec['rec']
 
+    def get_records(self, ids):
+        recs = {x['_id']: x['rec'] for x in self.db['records'].find({'_id': {'$in': ids}})}
+        return [recs.get(id) for id in ids]
+
+    def get_kind_links_many(self, kind, ids, limit=None):
+        results = {}
+        for id in ids:
+            cursor = self.db[id+'Linked'+kind].find().sort('_id', ASCENDING)
+            if limit is not None:
+                cursor = cursor.limit(limit)
+            results[id] = [x['_id'] for x in cursor]
+        return results
+
+    def iter_kind_links(self, kind, id, batch_size=1000):
+        for x in self.db[id+'Linked'+kind].find().sort('_id', ASCENDING).batch_size(batch_size):
+            yield x['_id']
+
+    def get_generation(self, id):
+        gen = self.db['generations'].find_one({'_id': id})
+        return gen['generation'] if gen is not None else 0
+
+    def get_generations(self, ids):
+        gens = {x['_id']: x['generation'] for x in self.db['generations'].find({'_id': {'$in': ids}})}
+        return [gens.get(x, 0) for x in ids]
+
+    def get_kind_generation(self, kind):
+        return self.get_generation(kind+'List')
+
     def get_kind_links(self, kind, id, cursor, limit):
         def peek(cursor, limit):
             if len([x['_id'] for x in self.db[id+'Linked'+kind].find()\
@@ -406,751 +864,3156 @@ class MongoStorageBackend(StorageBackend):
         next_cursor = peek(cursor, limit)
         return next_cursor, results
 
+    def count_kind(self, kind):
+        # Every ${kind}List document is a record, so the collection
+        # metadata count is exact without a query
+        return self.db[kind+'List'].estimated_document_count()
 
-def check_limit(limit):
-    ub = BLUEPRINT.config.get("MAX_LIMIT", 1000)
-    if limit > ub:
-        log.warn(
-            "Received request above MAX_LIMIT ({}), capping.".format(
-                str(ub)
-            )
-        )
-        limit = ub
-    return limit
+    def count_kind_links(self, kind, id):
+        return self.db[id+'Linked'+kind].estimated_document_count()
 
 
-class Root(Resource):
-    def get(self):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        return {
-            "object_list": API.url_for(ObjectList),
-            "event_list": API.url_for(EventList),
-            "agent_list": API.url_for(AgentList),
-            "rights_list": API.url_for(RightsList),
-            "relationship_list": API.url_for(RelationshipList)
-        }
+class StorageBackendWrapper(StorageBackend):
+    """
+    A StorageBackend adding behaviour to another StorageBackend
 
+    Every method is passed through to the wrapped backend, so subclasses
+    only override what they change. Attributes the wrapper doesn't have
+    (eg: .redis, .db) are looked up on the wrapped backend.
 
-class ObjectList(Resource):
-    def get(self):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
-        r = {}
-        q = BLUEPRINT.config['storage'].get_kind_list("object", args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['object_list'] = [{'id': x,
-                             '_link': API.url_for(Object, id=x)}
-                            for x in q[1]]
-        return r
+    __Args__
 
-    def post(self):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("record", type=str, required=True)
-        args = parser.parse_args()
-        try:
-            rec = pyqremis.Object.from_dict(loads(args['record']))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        objId = None
-        for x in rec.get_objectIdentifier():
-            if x.get_objectIdentifierType() == "uuid":
-                objId = x.get_objectIdentifierValue()
-        if objId is None:
-            raise MissingQremisUUIDIdentifierError()
-        relationships_to_link = []
-        try:
-            for x in rec.get_linkingRelationshipIdentifier():
-                if x.get_linkingRelationshipIdentifierType() == "uuid":
-                    relationships_to_link.append(x.get_linkingRelationshipIdentifierValue())
-                else:
-                    raise MissingQremisUUIDIdentifierError()
-            rec.del_linkingRelationshipIdentifier()
-        except KeyError:
-            pass
-        BLUEPRINT.config['storage'].add_record("object", objId, dumps(rec.to_dict()))
-        for x in relationships_to_link:
-            BLUEPRINT.config['storage'].link_records(
-                "object", objId, "relationship", x
-            )
-        r = {}
-        r['_link'] = API.url_for(Object, id=objId)
-        r['id'] = objId
-        return r
+    1. backend (StorageBackend): The backend to wrap
+    """
+    def __init__(self, backend):
+        self.backend = backend
 
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
 
-class Object(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        rec_str = BLUEPRINT.config['storage'].get_record(id)
-        try:
-            rec = pyqremis.Object.from_dict(loads(rec_str))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        for x in BLUEPRINT.config['storage'].get_kind_links("relationship", id, "0", None)[1]:
-            rec.add_linkingRelationshipIdentifier(
-                pyqremis.LinkingRelationshipIdentifier(
-                    linkingRelationshipIdentifierType="uuid",
-                    linkingRelationshipIdentifierValue=x
-                )
-            )
-        return rec.to_dict()
+    def record_exists(self, kind, id):
+        return self.backend.record_exists(kind, id)
 
+    def add_record(self, kind, id, rec):
+        return self.backend.add_record(kind, id, rec)
 
-class SparseObject(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        rec_str = BLUEPRINT.config['storage'].get_record(id)
-        try:
-            rec = pyqremis.Object.from_dict(loads(rec_str))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        return rec.to_dict()
+    def link_records(self, kind1, id1, kind2, id2):
+        return self.backend.link_records(kind1, id1, kind2, id2)
 
+    def link_records_many(self, links):
+        return self.backend.link_records_many(links)
 
-class ObjectLinkedRelationships(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
-        r = {}
-        q = BLUEPRINT.config['storage'].get_kind_links("relationship", id, args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['linkingRelationshipIdentifier_list'] = [
-            {'id': x, '_link':  API.url_for(Relationship, id=x)}
-            for x in q[1]
-        ]
-        return r
+    def replace_record(self, kind, id, old, new):
+        return self.backend.replace_record(kind, id, old, new)
 
-    def post(self, id):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("relationship_id", type=str, required=True)
-        args = parser.parse_args()
-        if not BLUEPRINT.config['storage'].record_exists("object", id):
-            raise IdentifierDoesNotExistError(str(id))
-        if not BLUEPRINT.config['storage'].record_exists("relationship", args['relationship_id']):
-            raise IdentifierDoesNotExistError(str(args['relationship_id']))
-        BLUEPRINT.config['storage'].link_records("object", id, "relationship", args['relationship_id'])
-        return id
+    def get_record(self, id):
+        return self.backend.get_record(id)
 
+    def get_records(self, ids):
+        return self.backend.get_records(ids)
 
-class EventList(Resource):
-    def get(self):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
-        r = {}
-        q = BLUEPRINT.config['storage'].get_kind_list("event", args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['event_list'] = [{'id': x, '_link': API.url_for(Event, id=x)}
-                           for x in q[1]]
-        return r
+    def get_kind_links_many(self, kind, ids, limit=None):
+        return self.backend.get_kind_links_many(kind, ids, limit)
 
-    def post(self):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("record", type=str, required=True)
-        args = parser.parse_args()
-        try:
-            rec = pyqremis.Event.from_dict(loads(args['record']))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        eventId = None
-        for x in rec.get_eventIdentifier():
-            if x.get_eventIdentifierType() == "uuid":
-                eventId = x.get_eventIdentifierValue()
-        if eventId is None:
-            raise MissingQremisUUIDIdentifierError()
-        relationships_to_link = []
-        try:
-            for x in rec.get_linkingRelationshipIdentifier():
-                if x.get_linkingRelationshipIdentifierType() == "uuid":
-                    relationships_to_link.append(x.get_linkingRelationshipIdentifierValue())
-                else:
-                    raise MissingQremisUUIDIdentifierError()
-            rec.del_linkingRelationshipIdentifier()
-        except KeyError:
-            pass
-        BLUEPRINT.config['storage'].add_record("event", eventId, dumps(rec.to_dict()))
-        for x in relationships_to_link:
-            BLUEPRINT.config['storage'].link_records(
-                "event", eventId, "relationship", x
-            )
-        r = {}
-        r['_link'] = API.url_for(Event, id=eventId)
-        r['id'] = eventId
-        return r
+    def get_kind_links(self, kind, id, cursor, limit):
+        return self.backend.get_kind_links(kind, id, cursor, limit)
 
+    def iter_kind_links(self, kind, id, batch_size=1000):
+        return self.backend.iter_kind_links(kind, id, batch_size)
 
-class Event(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        rec_str = BLUEPRINT.config['storage'].get_record(id)
-        try:
-            rec = pyqremis.Event.from_dict(loads(rec_str))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        for x in BLUEPRINT.config['storage'].get_kind_links("relationship", id, "0", None)[1]:
-            rec.add_linkingRelationshipIdentifier(
-                pyqremis.LinkingRelationshipIdentifier(
-                    linkingRelationshipIdentifierType="uuid",
-                    linkingRelationshipIdentifierValue=x
-                )
-            )
-        return rec.to_dict()
+    def get_generation(self, id):
+        return self.backend.get_generation(id)
 
+    def get_generations(self, ids):
+        return self.backend.get_generations(ids)
 
-class SparseEvent(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        rec_str = BLUEPRINT.config['storage'].get_record(id)
-        try:
-            rec = pyqremis.Event.from_dict(loads(rec_str))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        return rec.to_dict()
+    def get_kind_generation(self, kind):
+        return self.backend.get_kind_generation(kind)
 
+    def get_kind_list(self, kind, cursor, limit):
+        return self.backend.get_kind_list(kind, cursor, limit)
 
-class EventLinkedRelationships(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
-        r = {}
-        q = BLUEPRINT.config['storage'].get_kind_links("relationship", id, args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['linkingRelationshipIdentifier_list'] = [
-            {'id': x, '_link': API.url_for(Relationship, id=x)}
-            for x in q[1]
-        ]
-        return r
+    def count_kind(self, kind):
+        return self.backend.count_kind(kind)
 
-    def post(self, id):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("relationship_id", type=str, required=True)
-        args = parser.parse_args()
-        if not BLUEPRINT.config['storage'].record_exists("event", id):
+    def count_kind_links(self, kind, id):
+        return self.backend.count_kind_links(kind, id)
+
+    def stats(self):
+        return self.backend.stats()
+
+
+class LRUCache:
+    """
+    A thread safe least recently used cache, bounded by the total size
+    of its values rather than by their number
+
+    __Args__
+
+    1. max_size (int): The most bytes of values to hold
+    2. ttl (int/float/None): Seconds after which an entry expires, or None
+    """
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns a cached value, or None on a miss
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        """
+        Caches a value, evicting the least recently used values to make room
+
+        __Args__
+
+        1. key: The key
+        2. value: The value, which must not be None
+        3. size (int): The size of the value, in bytes
+        """
+        if size > self.max_size:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, expires)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def discard(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        self.size -= self.entries.pop(key)[1]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size": self.size,
+                "max_size": self.max_size
+            }
+
+
+class SharedMemoryCache:
+    """
+    A record cache shared by every process on a host, in a memory mapped file
+
+    The file holds a fixed number of fixed size slots. A key may live in
+    any of the `probes` slots following its hash, and when they are all
+    taken one is evicted with the clock (second chance) algorithm: reads
+    set a slot's reference bit, and the writer passes over referenced
+    slots once, clearing their bits, before evicting.
+
+    Reads take no lock. Every slot carries a sequence number which writers
+    make odd while they change the slot, so a reader which sees an odd or
+    changed sequence number retries, and otherwise gets a consistent copy.
+    Writers serialize on a lock on the file.
+
+    Has the same interface as LRUCache, for str keys and values.
+
+    __Args__
+
+    1. path (str): The file to map, eg: in /dev/shm. Processes using the
+        same path share the cache.
+    2. size (int): The size of the file, in bytes
+    3. slot_size (int): The size of each slot, in bytes. Values which
+        don't fit in a slot aren't cached.
+    4. ttl (int/float/None): Seconds after which entries expire, or None
+    """
+    magic = b"QREMISC2"
+    header = struct.Struct("<8sII")
+    # sequence number, reference bit, key length, value length, key hash,
+    # expiry time (0 for never)
+    slot_header = struct.Struct("<IBxHIQd")
+    max_key = 128
+    probes = 8
+
+    def __init__(self, path, size, slot_size=4096, ttl=None):
+        self.path = path
+        self.slot_size = slot_size
+        self.ttl = ttl
+        self.value_offset = self.slot_header.size + self.max_key
+        if slot_size <= self.value_offset:
+            raise ConfigError("Shared cache slots must be larger than {} bytes".format(
+                self.value_offset
+            ))
+        self.slots = (size - self.header.size) // slot_size
+        if self.slots < 1:
+            raise ConfigError("The shared cache is too small to hold a slot")
+        self.size = self.header.size + self.slots * slot_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size != self.size or \
+                    os.pread(self.fd, self.header.size, 0) != \
+                    self.header.pack(self.magic, self.slots, slot_size):
+                # Missing or laid out differently: start over, zeroed
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+                os.pwrite(self.fd, self.header.pack(self.magic, self.slots, slot_size), 0)
+            self.map = mmap.mmap(self.fd, self.size)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def hash(key):
+        return struct.unpack("<Q", blake2b(key, digest_size=8).digest())[0]
+
+    def offsets(self, h):
+        start = h % self.slots
+        for i in range(min(self.probes, self.slots)):
+            yield self.header.size + ((start + i) % self.slots) * self.slot_size
+
+    def read(self, offset, h, key):
+        """
+        Returns the value in a slot, if the slot holds the key
+        """
+        for _ in range(4):
+            seq, _ref, key_len, value_len, slot_hash, expires = \
+                self.slot_header.unpack_from(self.map, offset)
+            if seq & 1:
+                continue
+            if key_len == 0 or slot_hash != h or (expires and expires < time.time()):
+                return None
+            slot_key = self.map[offset + self.slot_header.size:offset + self.slot_header.size + key_len]
+            value = self.map[offset + self.value_offset:offset + self.value_offset + value_len]
+            if struct.unpack_from("<I", self.map, offset)[0] == seq:
+                return value if slot_key == key else None
+        return None
+
+    def write(self, offset, h, key, value, expires=0):
+        """
+        Writes a slot, or empties it if key is empty. Requires the write lock.
+        """
+        seq = struct.unpack_from("<I", self.map, offset)[0]
+        struct.pack_into("<I", self.map, offset, seq + 1)
+        self.map[offset + self.slot_header.size:offset + self.slot_header.size + len(key)] = key
+        self.map[offset + self.value_offset:offset + self.value_offset + len(value)] = value
+        self.slot_header.pack_into(self.map, offset, seq + 1, 0, len(key), len(value), h, expires)
+        struct.pack_into("<I", self.map, offset, seq + 2)
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the write lock, against both the other processes (a lock on
+        the file) and the other threads of this one
+        """
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def get(self, key):
+        key = key.encode("utf-8")
+        h = self.hash(key)
+        for offset in self.offsets(h):
+            value = self.read(offset, h, key)
+            if value is not None:
+                self.map[offset + 4] = 1
+                self.hits += 1
+                return value.decode("utf-8")
+        self.misses += 1
+        return None
+
+    def put(self, key, value, size=None):
+        key = key.encode("utf-8")
+        value = value.encode("utf-8")
+        if len(key) > self.max_key or len(value) > self.slot_size - self.value_offset:
+            return
+        h = self.hash(key)
+        offsets = list(self.offsets(h))
+        with self.locked():
+            victim = None
+            now = time.time()
+            for offset in offsets:
+                _seq, _ref, key_len, _value_len, slot_hash, expires = \
+                    self.slot_header.unpack_from(self.map, offset)
+                if key_len == 0 or (expires and expires < now) or \
+                        (slot_hash == h and self.read(offset, h, key) is not None):
+                    victim = offset
+                    break
+            if victim is None:
+                # Clock: give every referenced slot a second chance
+                for offset in offsets + offsets:
+                    if self.map[offset + 4]:
+                        self.map[offset + 4] = 0
+                    else:
+                        victim = offset
+                        break
+                self.evictions += 1
+            self.write(victim, h, key, value, now + self.ttl if self.ttl else 0)
+
+    def discard(self, key):
+        key = key.encode("utf-8")
+        h = self.hash(key)
+        with self.locked():
+            for offset in self.offsets(h):
+                if self.read(offset, h, key) is not None:
+                    self.write(offset, 0, b"", b"")
+
+    def stats(self):
+        entries = 0
+        for i in range(self.slots):
+            if self.slot_header.unpack_from(self.map, self.header.size + i * self.slot_size)[2]:
+                entries += 1
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "slots": self.slots,
+            "slot_size": self.slot_size,
+            "size": self.size
+        }
+
+
+class BloomFilter:
+    """
+    A Bloom filter of record identifiers per kind of record
+
+    Answers "definitely not stored" or "maybe stored". The bits live in a
+    memory mapped file, which every process on a host using the same path
+    shares, or in anonymous memory private to the process if no path is
+    given. Adding takes a write lock, testing takes none.
+
+    The file also keeps each kind's generation (see
+    StorageBackend.get_kind_generation()) as of its last rebuild, moved
+    on by one for every record added through it since. While that
+    matches the backend's, the filter has seen every record of the
+    kind, and restarts don't rescan it.
+
+    __Args__
+
+    1. path (str/None): The file to map, or None
+    2. capacity (int): The number of identifiers per kind the filter is sized for
+    3. error_rate (float): The false positive rate at capacity
+    """
+    magic = b"QREMISB2"
+    header = struct.Struct("<8sQI")
+    # The generation of each kind, then the number of rebuilds
+    generations = struct.Struct("<" + "q" * (len(record_kinds) + 1))
+
+    def __init__(self, path, capacity, error_rate=0.01):
+        self.bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.bits += -self.bits % 8
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.section_size = self.bits // 8
+        self.bits_offset = self.header.size + self.generations.size
+        self.size = self.bits_offset + self.section_size * len(record_kinds)
+        self.negatives = 0
+        self.lock = threading.Lock()
+        self.fd = None
+        if path is None:
+            self.map = mmap.mmap(-1, self.size)
+            self.map[:self.header.size] = self.header.pack(self.magic, self.bits, self.hashes)
+            self.generations.pack_into(self.map, self.header.size, *([-1] * len(record_kinds) + [0]))
+            return
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size != self.size or \
+                    os.pread(self.fd, self.header.size, 0) != \
+                    self.header.pack(self.magic, self.bits, self.hashes):
+                # Missing or sized differently: start over, empty
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+                os.pwrite(self.fd, self.header.pack(self.magic, self.bits, self.hashes), 0)
+                os.pwrite(self.fd, self.generations.pack(*([-1] * len(record_kinds) + [0])),
+                          self.header.size)
+            self.map = mmap.mmap(self.fd, self.size)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the write lock. Setting a bit rewrites its whole byte, so
+        concurrent adds could otherwise lose each other's bits.
+        """
+        with self.lock:
+            if self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if self.fd is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def positions(self, kind, id):
+        h1, h2 = struct.unpack("<QQ", blake2b(id.encode("utf-8"), digest_size=16).digest())
+        base = self.bits_offset + record_kinds.index(kind) * self.section_size
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.bits
+            yield base + bit // 8, 1 << (bit % 8)
+
+    def add(self, kind, id):
+        with self.locked():
+            for offset, mask in self.positions(kind, id):
+                self.map[offset] |= mask
+
+    def might_contain(self, kind, id):
+        for offset, mask in self.positions(kind, id):
+            if not self.map[offset] & mask:
+                return False
+        return True
+
+    def get_generations(self):
+        return dict(zip(record_kinds, self.generations.unpack_from(self.map, self.header.size)))
+
+    def get_epoch(self):
+        return self.generations.unpack_from(self.map, self.header.size)[-1]
+
+    def rebuilt(self, generations):
+        """
+        Records the generations a rebuild saw, starting a new epoch
+
+        __Args__
+
+        1. generations ([int]): The generation of each kind, in the order
+            of record_kinds, read before the rebuild scanned the listings
+        """
+        with self.locked():
+            self.generations.pack_into(self.map, self.header.size,
+                                       *(list(generations) + [self.get_epoch() + 1]))
+
+    def added(self, kind, epoch):
+        """
+        Moves a kind's generation on, once a record added to the filter
+        has been stored
+
+        An add which began before the last rebuild finished may have been
+        counted by it already, so it is only counted if epoch, read before
+        the record was stored, is still current.
+
+        __Args__
+
+        1. kind (str): The kind of the record
+        2. epoch (int): get_epoch(), as of before the record was stored
+        """
+        with self.locked():
+            values = list(self.generations.unpack_from(self.map, self.header.size))
+            i = record_kinds.index(kind)
+            if values[-1] == epoch and values[i] >= 0:
+                values[i] += 1
+                self.generations.pack_into(self.map, self.header.size, *values)
+
+    def stats(self):
+        fill_ratio = {}
+        for i, kind in enumerate(record_kinds):
+            start = self.bits_offset + i * self.section_size
+            fill_ratio[kind] = sum(
+                bin(x).count("1") for x in self.map[start:start + self.section_size]
+            ) / self.bits
+        return {
+            "bits": self.bits,
+            "hashes": self.hashes,
+            "fill_ratio": fill_ratio
+        }
+
+
+class BloomFilterStorageBackend(StorageBackendWrapper):
+    """
+    Answers lookups of identifiers which were never stored without asking
+    the wrapped backend
+
+    A negative is only trusted while the filter has seen every record of
+    the kind, ie: while its generation for the kind matches the backend's
+    (see BloomFilter). That is checked at most once every recheck seconds.
+    Once records are added which the filter didn't see (eg: by another
+    host), lookups go to the backend, and the filter is rebuilt in the
+    background, at most once every rebuild_interval seconds.
+
+    __Args__
+
+    1. backend (StorageBackend): The backend to wrap
+    2. bloom_filter (BloomFilter): The filter
+    3. recheck (int/float): Seconds to trust a check of the generations for
+    4. rebuild_interval (int/float): The fewest seconds between background
+        rebuilds
+    """
+    def __init__(self, backend, bloom_filter, recheck=1, rebuild_interval=60):
+        super().__init__(backend)
+        self.filter = bloom_filter
+        self.recheck = recheck
+        self.rebuild_interval = rebuild_interval
+        self.negatives = 0
+        self.checked = {}
+        self.rebuilding = threading.Lock()
+        self.rebuilt_at = None
+
+    def rebuild(self, batch_size=10000):
+        """
+        Adds every stored identifier to the filter, scanning the ${kind}List
+        of each kind which changed since the filter was last rebuilt
+        """
+        built = self.filter.get_generations()
+        current = {x: self.backend.get_kind_generation(x) for x in record_kinds}
+        for kind in record_kinds:
+            if built[kind] == current[kind]:
+                continue
+            log.info("Rebuilding the {} Bloom filter".format(kind))
+            cursor = "0"
+            while True:
+                cursor, ids = self.backend.get_kind_list(kind, cursor, batch_size)
+                for x in ids:
+                    self.filter.add(kind, x)
+                if not cursor or cursor == "0":
+                    break
+        self.filter.rebuilt([current[x] for x in record_kinds])
+        self.checked = {}
+
+    def rebuild_later(self):
+        if self.rebuilt_at is not None and time.monotonic() - self.rebuilt_at < self.rebuild_interval:
+            return
+        if not self.rebuilding.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.rebuild()
+            except Exception:
+                log.exception("Failed to rebuild the Bloom filter")
+            finally:
+                self.rebuilt_at = time.monotonic()
+                self.rebuilding.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def is_current(self, kind):
+        """
+        Determines whether the filter has seen every stored record of a kind
+        """
+        checked_at, current = self.checked.get(kind, (None, False))
+        if checked_at is None or time.monotonic() - checked_at >= self.recheck:
+            current = self.filter.get_generations()[kind] == self.backend.get_kind_generation(kind)
+            self.checked[kind] = (time.monotonic(), current)
+            if not current:
+                self.rebuild_later()
+        return current
+
+    def might_exist(self, id):
+        if any(self.filter.might_contain(x, id) or not self.is_current(x) for x in record_kinds):
+            return True
+        self.negatives += 1
+        return False
+
+    def record_exists(self, kind, id):
+        if not self.filter.might_contain(kind, id) and self.is_current(kind):
+            self.negatives += 1
+            return False
+        return self.backend.record_exists(kind, id)
+
+    def add_record(self, kind, id, rec):
+        # Added first, so there is never a moment the record exists but
+        # the filter denies it. A failed write only leaves a false positive.
+        self.filter.add(kind, id)
+        epoch = self.filter.get_epoch()
+        result = self.backend.add_record(kind, id, rec)
+        self.filter.added(kind, epoch)
+        return result
+
+    def get_record(self, id):
+        if not self.might_exist(id):
             raise IdentifierDoesNotExistError(str(id))
-        if not BLUEPRINT.config['storage'].record_exists("relationship", args['relationship_id']):
-            raise IdentifierDoesNotExistError(str(args['relationship_id']))
-        BLUEPRINT.config['storage'].link_records("event", id, "relationship", args['relationship_id'])
-        return id
+        return self.backend.get_record(id)
+
+    def get_records(self, ids):
+        candidates = [x for x in ids if self.might_exist(x)]
+        found = dict(zip(candidates, self.backend.get_records(candidates) if candidates else []))
+        return [found.get(x) for x in ids]
+
+    def stats(self):
+        stats = dict(self.backend.stats())
+        stats['bloom_filter'] = dict(self.filter.stats(), negatives=self.negatives)
+        return stats
+
+
+class CachingStorageBackend(StorageBackendWrapper):
+    """
+    Caches records and complete link sets in front of another backend
+
+    Records and link sets are cached separately, under the generation of
+    their record (see get_generation()). Every write to a record moves its
+    generation, whichever process makes it, so entries of an older
+    generation are never served again (they are left for the cache to
+    evict).
+
+    With a ttl, generations are cached too, for ttl seconds, so a hit
+    doesn't touch the backend. Writes made through this backend forget
+    the generations of the records they touch at once, while writes made
+    by other processes are seen within ttl seconds. Conditional GETs take
+    their ETags from the same cached generations, so a 304 is never based
+    on a newer generation than the record served. Without a ttl every
+    lookup reads the generation (one read per batch) first.
+
+    __Args__
+
+    1. backend (StorageBackend): The backend to wrap
+    2. record_size (int/None): The most bytes of records to cache, or None
+        to not cache records
+    3. link_size (int/None): The most bytes of link sets to cache, or None
+        to not cache link sets
+    4. ttl (int/float/None): Seconds after which cache entries expire, or None
+    5. record_cache (LRUCache/SharedMemoryCache/None): A cache to hold the
+        records in, instead of an LRUCache of record_size bytes
+    6. generation_entries (int): The most generations to cache
+    """
+    def __init__(self, backend, record_size=None, link_size=None, ttl=None, record_cache=None,
+                 generation_entries=100000):
+        super().__init__(backend)
+        self.records = record_cache
+        if self.records is None and record_size:
+            self.records = LRUCache(record_size, ttl)
+        self.links = LRUCache(link_size, ttl) if link_size else None
+        self.generations = LRUCache(generation_entries, ttl) if ttl is not None else None
 
+    @staticmethod
+    def links_size(ids):
+        return sum(len(x) + 1 for x in ids)
 
-class AgentList(Resource):
-    def get(self):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
-        r = {}
-        q = BLUEPRINT.config['storage'].get_kind_list("agent", args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['agent_list'] = [{'id': x, '_link': API.url_for(Agent, id=x)}
-                           for x in q[1]]
-        return r
+    @staticmethod
+    def record_key(id, generation):
+        # str keys, for the shared cache. Generations are digits, so the
+        # last "@" tells the parts apart.
+        return "{}@{}".format(id, generation)
 
-    def post(self):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("record", type=str, required=True)
-        args = parser.parse_args()
+    def forget_generations(self, ids):
+        if self.generations is not None:
+            for x in ids:
+                self.generations.discard(x)
+
+    def add_record(self, kind, id, rec):
         try:
-            rec = pyqremis.Agent.from_dict(loads(args['record']))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        agentId = None
-        for x in rec.get_agentIdentifier():
-            if x.get_agentIdentifierType() == "uuid":
-                agentId = x.get_agentIdentifierValue()
-        if agentId is None:
-            raise MissingQremisUUIDIdentifierError()
-        relationships_to_link = []
+            return self.backend.add_record(kind, id, rec)
+        finally:
+            self.forget_generations([id])
+
+    def link_records(self, kind1, id1, kind2, id2):
         try:
-            for x in rec.get_linkingRelationshipIdentifier():
-                if x.get_linkingRelationshipIdentifierType() == "uuid":
-                    relationships_to_link.append(x.get_linkingRelationshipIdentifierValue())
-                else:
-                    raise MissingQremisUUIDIdentifierError()
-            rec.del_linkingRelationshipIdentifier()
-        except KeyError:
-            pass
-        BLUEPRINT.config['storage'].add_record("agent", agentId, dumps(rec.to_dict()))
-        for x in relationships_to_link:
-            BLUEPRINT.config['storage'].link_records(
-                "agent", agentId, "relationship", x
-            )
-        r = {}
-        r['_link'] = API.url_for(Agent, id=agentId)
-        r['id'] = agentId
-        return r
+            return self.backend.link_records(kind1, id1, kind2, id2)
+        finally:
+            self.forget_generations([id1, id2])
 
+    def link_records_many(self, links):
+        try:
+            return self.backend.link_records_many(links)
+        finally:
+            self.forget_generations(set(x[1] for x in links) | set(x[3] for x in links))
 
-class Agent(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        rec_str = BLUEPRINT.config['storage'].get_record(id)
+    def replace_record(self, kind, id, old, new):
+        # A failed swap may mean a cached record was stale, so the
+        # generation is forgotten either way
         try:
-            rec = pyqremis.Agent.from_dict(loads(rec_str))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        for x in BLUEPRINT.config['storage'].get_kind_links("relationship", id, "0", None)[1]:
-            rec.add_linkingRelationshipIdentifier(
-                pyqremis.LinkingRelationshipIdentifier(
-                    linkingRelationshipIdentifierType="uuid",
-                    linkingRelationshipIdentifierValue=x
-                )
-            )
-        return rec.to_dict()
+            return self.backend.replace_record(kind, id, old, new)
+        finally:
+            self.forget_generations([id])
+
+    def get_generation(self, id):
+        if self.generations is None:
+            return self.backend.get_generation(id)
+        generation = self.generations.get(id)
+        if generation is None:
+            generation = self.backend.get_generation(id)
+            self.generations.put(id, generation, 1)
+        return generation
+
+    def get_generations(self, ids):
+        if self.generations is None:
+            return self.backend.get_generations(ids)
+        results = [self.generations.get(x) for x in ids]
+        missing = [x for x, generation in zip(ids, results) if generation is None]
+        if missing:
+            fetched = dict(zip(missing, self.backend.get_generations(missing)))
+            for x in missing:
+                self.generations.put(x, fetched[x], 1)
+            results = [fetched[x] if generation is None else generation
+                       for x, generation in zip(ids, results)]
+        return results
 
+    def get_record(self, id):
+        if self.records is None:
+            return self.backend.get_record(id)
+        key = self.record_key(id, self.get_generation(id))
+        rec = self.records.get(key)
+        if rec is None:
+            rec = self.backend.get_record(id)
+            self.records.put(key, rec, len(rec))
+        return rec
+
+    def get_records(self, ids):
+        if self.records is None:
+            return self.backend.get_records(ids)
+        keys = [self.record_key(x, y) for x, y in zip(ids, self.get_generations(ids))]
+        results = [self.records.get(x) for x in keys]
+        missing = [x for x, rec in zip(ids, results) if rec is None]
+        if missing:
+            fetched = dict(zip(missing, self.backend.get_records(missing)))
+            for x, key, rec in zip(ids, keys, results):
+                if rec is None and fetched[x] is not None:
+                    self.records.put(key, fetched[x], len(fetched[x]))
+            results = [fetched[x] if rec is None else rec for x, rec in zip(ids, results)]
+        return results
+
+    def get_kind_links_many(self, kind, ids, limit=None):
+        if self.links is None:
+            return self.backend.get_kind_links_many(kind, ids, limit)
+        keys = dict(zip(ids, [(kind, x, y) for x, y in zip(ids, self.get_generations(ids))]))
+        results = {}
+        for x in ids:
+            cached = self.links.get(keys[x])
+            if cached is not None:
+                results[x] = cached[:limit]
+        missing = [x for x in ids if x not in results]
+        if missing:
+            fetched = self.backend.get_kind_links_many(kind, missing, limit)
+            for x, links in fetched.items():
+                # A fetch which came in under the limit got the whole set
+                if limit is None or len(links) < limit:
+                    self.links.put(keys[x], links, self.links_size(links))
+            results.update(fetched)
+        return results
+
+    def iter_kind_links(self, kind, id, batch_size=1000):
+        cached = None
+        if self.links is not None:
+            cached = self.links.get((kind, id, self.get_generation(id)))
+        if cached is not None:
+            return iter(cached)
+        return self.backend.iter_kind_links(kind, id, batch_size)
+
+    def stats(self):
+        stats = dict(self.backend.stats())
+        if self.records is not None:
+            stats['record_cache'] = self.records.stats()
+        if self.links is not None:
+            stats['link_cache'] = self.links.stats()
+        if self.generations is not None:
+            stats['generation_cache'] = self.generations.stats()
+        return stats
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while a dependency is failing
+
+    After threshold consecutive failures the breaker opens, and calls
+    are refused for reset_timeout seconds. Then it is half open: one
+    call is let through, which closes the breaker if it succeeds and
+    opens it again if it fails.
+
+    __Args__
+
+    1. threshold (int): The consecutive failures which open the breaker
+    2. reset_timeout (int/float): Seconds to stay open for
+    """
+    def __init__(self, threshold=5, reset_timeout=10):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.opened = 0
+        self.refused = 0
+
+    def allow(self):
+        """
+        __Returns__
 
-class SparseAgent(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        rec_str = BLUEPRINT.config['storage'].get_record(id)
+        * (int/float/None): None if a call may go ahead, otherwise the
+            seconds until the breaker lets a call through again
+        """
+        with self.lock:
+            if self.state == "closed":
+                return None
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining <= 0 and not self.trial:
+                self.state = "half_open"
+                self.trial = True
+                return None
+            self.refused += 1
+            return max(remaining, 0)
+
+    def succeeded(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+            self.trial = False
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened": self.opened,
+                "refused": self.refused
+            }
+
+
+class PolicyStorageBackend(StorageBackendWrapper):
+    """
+    Retries idempotent reads, and fails fast while the backend is down
+
+    Connection errors and timeouts (see BACKEND_TIMEOUT, which bounds
+    every round trip) count as failures. Reads are retried up to retries
+    times, sleeping a random time of up to backoff * 2**attempt seconds
+    in between. Writes aren't retried, as a write which timed out may
+    have been made. Once the circuit breaker opens, calls are refused
+    with a ServiceUnavailableError, without touching the backend.
+
+    __Args__
+
+    1. backend (StorageBackend): The backend to wrap
+    2. breaker (CircuitBreaker): The breaker for the backend
+    3. retries (int): The most times to retry a read
+    4. backoff (int/float): The base, in seconds, of the backoff between retries
+    """
+    transient_errors = (redis.ConnectionError, redis.TimeoutError, ConnectionFailure)
+
+    def __init__(self, backend, breaker, retries=2, backoff=0.05):
+        super().__init__(backend)
+        self.breaker = breaker
+        self.retries = retries
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.retried = 0
+
+    def call(self, retry, fn, *args):
+        attempt = 0
+        while True:
+            retry_after = self.breaker.allow()
+            if retry_after is not None:
+                raise ServiceUnavailableError("The storage backend is unavailable",
+                                              int(math.ceil(retry_after)) or 1)
+            try:
+                result = fn(*args)
+            except self.transient_errors as e:
+                self.breaker.failed()
+                if not retry or attempt >= self.retries:
+                    log.warning("Storage backend call failed: {}".format(e))
+                    raise ServiceUnavailableError("The storage backend is unavailable",
+                                                  int(math.ceil(self.breaker.reset_timeout)))
+                with self.lock:
+                    self.retried += 1
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                attempt += 1
+                continue
+            except Exception:
+                # Errors of the request (eg: missing records) mean the backend is up
+                self.breaker.succeeded()
+                raise
+            self.breaker.succeeded()
+            return result
+
+    def record_exists(self, kind, id):
+        return self.call(True, self.backend.record_exists, kind, id)
+
+    def add_record(self, kind, id, rec):
+        return self.call(False, self.backend.add_record, kind, id, rec)
+
+    def link_records(self, kind1, id1, kind2, id2):
+        return self.call(False, self.backend.link_records, kind1, id1, kind2, id2)
+
+    def link_records_many(self, links):
+        return self.call(False, self.backend.link_records_many, links)
+
+    def replace_record(self, kind, id, old, new):
+        return self.call(False, self.backend.replace_record, kind, id, old, new)
+
+    def get_record(self, id):
+        return self.call(True, self.backend.get_record, id)
+
+    def get_records(self, ids):
+        return self.call(True, self.backend.get_records, ids)
+
+    def get_kind_links_many(self, kind, ids, limit=None):
+        return self.call(True, self.backend.get_kind_links_many, kind, ids, limit)
+
+    def get_kind_links(self, kind, id, cursor, limit):
+        return self.call(True, self.backend.get_kind_links, kind, id, cursor, limit)
+
+    def get_generation(self, id):
+        return self.call(True, self.backend.get_generation, id)
+
+    def get_generations(self, ids):
+        return self.call(True, self.backend.get_generations, ids)
+
+    def get_kind_generation(self, kind):
+        return self.call(True, self.backend.get_kind_generation, kind)
+
+    def get_kind_list(self, kind, cursor, limit):
+        return self.call(True, self.backend.get_kind_list, kind, cursor, limit)
+
+    def count_kind(self, kind):
+        return self.call(True, self.backend.count_kind, kind)
+
+    def count_kind_links(self, kind, id):
+        return self.call(True, self.backend.count_kind_links, kind, id)
+
+    def stats(self):
+        stats = dict(self.backend.stats())
+        stats['breaker'] = self.breaker.stats()
+        with self.lock:
+            stats['breaker']['retried'] = self.retried
+        return stats
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a key is in
+    flight, further callers for the key wait for its result instead of
+    making their own call
+
+    Waiting callers share the result object, so it must not be mutated.
+    """
+    class Flight:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args):
+        """
+        Calls fn(*args), unless a call for key is already in flight
+
+        __Args__
+
+        1. key (hashable): Identifies the call
+        2. fn (callable): The function to call
+        3. *args: Its arguments
+
+        __Returns__
+
+        * The result of the in flight call, raising its exception if it raised
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.Flight()
+                self.flights[key] = flight
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
         try:
-            rec = pyqremis.Agent.from_dict(loads(rec_str))
+            flight.result = fn(*args)
         except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        return rec.to_dict()
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self.flights)
+            }
+
+
+class SingleFlightStorageBackend(StorageBackendWrapper):
+    """
+    Coalesces concurrent identical reads from the threads of a process,
+    so a burst of requests for the same record costs the backend one read
+
+    __Args__
+
+    1. backend (StorageBackend): The backend to wrap
+    """
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.flights = SingleFlight()
 
+    def get_record(self, id):
+        return self.flights.do(("record", id), self.backend.get_record, id)
+
+    def get_records(self, ids):
+        return self.flights.do(("records", tuple(ids)), self.backend.get_records, ids)
+
+    def get_kind_links_many(self, kind, ids, limit=None):
+        return self.flights.do(("links", kind, tuple(ids), limit),
+                               self.backend.get_kind_links_many, kind, ids, limit)
+
+    def get_kind_links(self, kind, id, cursor, limit):
+        return self.flights.do(("links_page", kind, id, cursor, limit),
+                               self.backend.get_kind_links, kind, id, cursor, limit)
+
+    def get_kind_list(self, kind, cursor, limit):
+        return self.flights.do(("list_page", kind, cursor, limit),
+                               self.backend.get_kind_list, kind, cursor, limit)
+
+    def count_kind_links(self, kind, id):
+        return self.flights.do(("count_links", kind, id),
+                               self.backend.count_kind_links, kind, id)
+
+    def get_generation(self, id):
+        return self.flights.do(("generation", id), self.backend.get_generation, id)
+
+    def stats(self):
+        stats = dict(self.backend.stats())
+        stats['single_flight'] = self.flights.stats()
+        return stats
+
+
+class WriteCoalescer:
+    """
+    Gathers the writes of concurrent callers into batches, each written
+    with one call
+
+    The first caller to add to an empty batch waits up to window seconds,
+    or until the batch holds max_size writes, then flushes it. Every
+    caller returns once the flush holding its writes has, so a caller is
+    only acknowledged after its own writes are made.
+
+    __Args__
+
+    1. flush (callable): Writes a list of writes
+    2. window (int/float): The most seconds to gather writes for
+    3. max_size (int): The most writes to gather before flushing early
+    """
+    class Batch:
+        def __init__(self):
+            self.writes = []
+            self.callers = []
+            self.full = threading.Event()
+            self.done = threading.Event()
+            self.errors = {}
+
+    def __init__(self, flush, window=0.002, max_size=100):
+        self.flush = flush
+        self.window = window
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.batch = None
+        self.flushes = 0
+        self.writes = 0
+        self.largest = 0
+
+    def write(self, writes):
+        """
+        Adds writes to the current batch, and waits for it to be flushed
+
+        __Args__
+
+        1. writes ([object]): The writes to make
+
+        __Returns__
+
+        * None, raising the exception of the flush if it raised
+        """
+        with self.lock:
+            batch = self.batch
+            leader = batch is None
+            if leader:
+                batch = self.Batch()
+                self.batch = batch
+            caller = len(batch.callers)
+            batch.callers.append(writes)
+            batch.writes.extend(writes)
+            if len(batch.writes) >= self.max_size:
+                # Nothing more joins a full batch
+                self.batch = None
+                batch.full.set()
+        if not leader:
+            batch.done.wait()
+        else:
+            batch.full.wait(self.window)
+            with self.lock:
+                if self.batch is batch:
+                    self.batch = None
+                self.flushes += 1
+                self.writes += len(batch.writes)
+                self.largest = max(self.largest, len(batch.writes))
+            try:
+                self.flush(batch.writes)
+            except Exception:
+                # Redo the writes caller by caller, so a bad write only
+                # fails the request which made it
+                for i, x in enumerate(batch.callers):
+                    try:
+                        self.flush(x)
+                    except Exception as e:
+                        batch.errors[i] = e
+            finally:
+                batch.done.set()
+        if caller in batch.errors:
+            raise batch.errors[caller]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "flushes": self.flushes,
+                "writes": self.writes,
+                "largest_batch": self.largest
+            }
+
+
+class CoalescingStorageBackend(StorageBackendWrapper):
+    """
+    Coalesces the link writes of concurrent requests into batched writes,
+    one redis pipeline or set of mongo bulk writes per batch
+
+    Each request's links are written before its link_records() or
+    link_records_many() call returns, at the cost of up to window
+    seconds of latency.
+
+    __Args__
+
+    1. backend (StorageBackend): The backend to wrap
+    2. window (int/float): The most seconds to gather link writes for
+    3. max_size (int): The most links to gather before writing early
+    """
+    def __init__(self, backend, window=0.002, max_size=100):
+        super().__init__(backend)
+        self.coalescer = WriteCoalescer(self.backend.link_records_many, window, max_size)
+
+    def link_records(self, kind1, id1, kind2, id2):
+        self.coalescer.write([(kind1, id1, kind2, id2)])
+
+    def link_records_many(self, links):
+        if links:
+            self.coalescer.write(list(links))
+
+    def stats(self):
+        stats = dict(self.backend.stats())
+        stats['link_coalescer'] = self.coalescer.stats()
+        return stats
+
+
+class AccessSummary:
+    """
+    Counts how often each record is read, and persists the most read
+    records to a file which every process using the same path merges into
+
+    The counts already in the file are halved at every merge, so the
+    summary follows recent reads rather than all time ones.
+
+    __Args__
+
+    1. path (str): The file to persist the summary to
+    2. size (int): The most records to keep in the summary
+    3. interval (int/float): The least seconds between persists
+    """
+    def __init__(self, path, size=10000, interval=60):
+        self.path = path
+        self.size = size
+        self.interval = interval
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.persisted = time.monotonic()
+
+    def record(self, kind, id):
+        """
+        Counts a read of a record, persisting the counts if they are due
+        """
+        with self.lock:
+            key = (kind, id)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if len(self.counts) > self.size * 2:
+                # Drop the least read half, bounding the memory used
+                keep = sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:self.size]
+                self.counts = dict(keep)
+            due = time.monotonic() - self.persisted >= self.interval
+        if due:
+            self.persist()
+
+    def persist(self):
+        """
+        Adds the counts since the last persist to the halved counts of the
+        summary file
+        """
+        with self.lock:
+            counts, self.counts = self.counts, {}
+            self.persisted = time.monotonic()
+        if not counts:
+            return
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            for kind, id, count in self.load(self.path):
+                if count // 2:
+                    counts[(kind, id)] = counts.get((kind, id), 0) + count // 2
+            top = sorted(counts.items(), key=lambda x: x[1], reverse=True)[:self.size]
+            with open(self.path + ".tmp", "w") as f:
+                f.write(dumps([[kind, id, count] for (kind, id), count in top]))
+            os.replace(self.path + ".tmp", self.path)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def load(path):
+        """
+        Reads a summary file
+
+        __Args__
+
+        1. path (str): The file
+
+        __Returns__
+
+        * ([(str, str, int)]): (kind, identifier, count) triples, most read
+            first, or an empty list if there is no summary yet
+        """
+        try:
+            with open(path) as f:
+                summary = loads(f.read())
+        except (IOError, ValueError):
+            return []
+        if not isinstance(summary, list):
+            return []
+        # Entries which aren't well formed are dropped, rather than failing startup
+        return [tuple(x) for x in summary if isinstance(x, list) and len(x) == 3 and
+                x[0] in record_kinds and isinstance(x[1], str) and isinstance(x[2], int)]
+
+
+def warm_up(storage, records, seconds=None, max_size=None, batch_size=100):
+    """
+    Reads records, and the links a full GET of them would embed, through
+    the storage backend so its caches hold them before any request comes in
+
+    __Args__
+
+    1. storage (StorageBackend): The (caching) storage backend
+    2. records ([(str, str)]): (kind, identifier) pairs, most important first
+    3. seconds (int/float/None): Stop after this many seconds
+    4. max_size (int/None): Stop after reading this many bytes of records
+    5. batch_size (int): How many records to read at a time
+
+    __Returns__
+
+    * (int): The number of records read
+    """
+    started = time.monotonic()
+    limit = BLUEPRINT.config.get("HYDRATION_LIMIT") or None
+    read = 0
+    size = 0
+    for i in range(0, len(records), batch_size):
+        if seconds is not None and time.monotonic() - started > seconds:
+            break
+        if max_size is not None and size >= max_size:
+            break
+        batch = records[i:i + batch_size]
+        recs = storage.get_records([id for kind, id in batch])
+        size += sum(len(x) for x in recs if x is not None)
+        read += len(batch)
+        by_kind = {}
+        for (kind, id), rec in zip(batch, recs):
+            if rec is not None and kind in record_kinds:
+                by_kind.setdefault(kind, []).append(id)
+        for kind, ids in by_kind.items():
+            for x in record_links[kind]:
+                storage.get_kind_links_many(x, ids, limit)
+    log.info("Warmed up {} records ({} bytes) in {:.2f}s".format(
+        read, size, time.monotonic() - started
+    ))
+    return read
+
+
+def warm_up_records():
+    """
+    Lists the records to warm up with: those in the WARM_UP_IDS file (one
+    "kind identifier" per line) followed by the most read in the access
+    summary
+
+    __Returns__
+
+    * ([(str, str)]): (kind, identifier) pairs
+    """
+    records = []
+    if BLUEPRINT.config.get('WARM_UP_IDS'):
+        with open(BLUEPRINT.config['WARM_UP_IDS']) as f:
+            for line in f:
+                fields = line.split()
+                if not fields:
+                    continue
+                if len(fields) != 2 or fields[0] not in record_kinds:
+                    log.warning("Skipping malformed warm up line: {}".format(line.strip()))
+                    continue
+                records.append((fields[0], fields[1]))
+    if BLUEPRINT.config.get('ACCESS_SUMMARY_PATH'):
+        seen = set(records)
+        records += [(kind, id) for kind, id, _count in
+                    AccessSummary.load(BLUEPRINT.config['ACCESS_SUMMARY_PATH'])
+                    if (kind, id) not in seen]
+    return records
+
+
+def record_access(kind, id):
+    """
+    Counts a read of a record in the access summary, if one is kept
+
+    Only reads which found the record count, so lookups of identifiers
+    which don't exist can't push the records which do out of the summary.
+    """
+    if BLUEPRINT.config.get('access_summary') is not None:
+        BLUEPRINT.config['access_summary'].record(kind, id)
+
+
+class SchemaValidator:
+    """
+    Validates incoming records against JSON Schemas compiled once at startup
+
+    Records are checked and normalized as plain dicts, in place of
+    building (and then re-serializing) a pyqremis object graph.
+    """
+    def __init__(self, schemas):
+        """
+        __Args__
+
+        1. schemas (dict): A JSON Schema for each kind of record,
+            keyed by kind (see module record_kinds)
+        """
+        if jsonschema is None:
+            raise ConfigError("Schema validation requires the jsonschema package!")
+        self.validators = {}
+        for kind in record_kinds:
+            try:
+                schema = schemas[kind]
+            except KeyError:
+                raise ConfigError("No schema provided for {} records!".format(kind))
+            cls = jsonschema.validators.validator_for(schema)
+            try:
+                cls.check_schema(schema)
+            except jsonschema.exceptions.SchemaError as e:
+                raise ConfigError("Invalid {} schema: {}".format(kind, e.message))
+            self.validators[kind] = cls(schema)
+
+    def validate(self, kind, rec):
+        """
+        Validates and normalizes a record
+
+        __Args__
+
+        1. kind (str): The kind of record (see module record_kinds)
+        2. rec (dict): The record, as parsed from JSON
+
+        __Returns__
+
+        * (str, {str: [str]}, dict): The record's uuid identifier, the
+            identifiers it links to keyed by kind, and the record with
+            its linking fields removed
+        """
+        error = jsonschema.exceptions.best_match(self.validators[kind].iter_errors(rec))
+        if error is not None:
+            raise InvalidQremisRecordError(error.message)
+        return normalize_record(kind, rec)
+
+
+def identifier_entries(entries, field):
+    """
+    Checks a record's identifier or linking entries
+
+    __Args__
+
+    1. entries (list/None): The entries, as parsed from JSON
+    2. field (str): The name of the field holding them
+
+    __Returns__
+
+    * ([(str, str)]): The type and value of each entry
+    """
+    if entries is None:
+        return []
+    if not isinstance(entries, list):
+        raise InvalidQremisRecordError("{} must be an array".format(field))
+    pairs = []
+    for x in entries:
+        if not isinstance(x, dict) or not isinstance(x.get(field + "Type"), str) or \
+                not isinstance(x.get(field + "Value"), str):
+            raise InvalidQremisRecordError(
+                "Every {0} must be an object with a string {0}Type and {0}Value".format(field)
+            )
+        pairs.append((x[field + "Type"], x[field + "Value"]))
+    return pairs
+
+
+def normalize_record(kind, rec):
+    """
+    Pulls the uuid identifier and the linking identifiers out of a record
+
+    Nothing is stored until this has checked the whole record, so a
+    malformed linking field can't leave a record stored without its links.
+
+    __Args__
+
+    1. kind (str): The kind of record (see module record_kinds)
+    2. rec (dict): The record, as parsed from JSON. Its linking fields
+        are removed in place.
+
+    __Returns__
+
+    * (str, {str: [str]}, dict): The record's uuid identifier, the
+        identifiers it links to keyed by kind, and the record
+    """
+    if not isinstance(rec, dict):
+        raise InvalidQremisRecordError("A QREMIS record must be a JSON object")
+    id_field = kind + "Identifier"
+    recId = None
+    for id_type, value in identifier_entries(rec.get(id_field), id_field):
+        if id_type == "uuid":
+            recId = value
+    if recId is None:
+        raise MissingQremisUUIDIdentifierError()
+    links = {}
+    for linked_kind in record_links[kind]:
+        field = linking_field(linked_kind)
+        links[linked_kind] = []
+        for id_type, value in identifier_entries(rec.pop(field, None), field):
+            if id_type != "uuid":
+                raise MissingQremisUUIDIdentifierError()
+            links[linked_kind].append(value)
+    return recId, links, rec
+
+
+def prepare_validated(kind, record):
+    """
+    Validates a record with the configured SchemaValidator
+
+    __Args__
+
+    1. kind (str): The kind of record (see module record_kinds)
+    2. record (str): The JSON str representing the record
+
+    __Returns__
+
+    * (str, str, {str: [str]}): The identifier of the record, the JSON
+        str to store, without links, and the identifiers to link it to
+    """
+    try:
+        rec = json_engine().loads(record)
+    except ValueError as e:
+        raise InvalidQremisRecordError(str(e))
+    recId, links, rec = BLUEPRINT.config['validator'].validate(kind, rec)
+    return recId, json_engine().dumps(rec), links
+
+
+def ingest_validated(kind, record):
+    """
+    Validates a record with the configured SchemaValidator, then stores
+    and links it
+
+    __Args__
+
+    1. kind (str): The kind of record (see module record_kinds)
+    2. record (str): The JSON str representing the record
+
+    __Returns__
+
+    * (str): The identifier of the stored record
+    """
+    recId, rec_str, links = prepare_validated(kind, record)
+    store_record(kind, recId, rec_str, links)
+    return recId
+
+
+def check_limit(limit):
+    ub = BLUEPRINT.config.get("MAX_LIMIT", 1000)
+    if limit > ub:
+        log.warn(
+            "Received request above MAX_LIMIT ({}), capping.".format(
+                str(ub)
+            )
+        )
+        limit = ub
+    return limit
+
+
+def passthrough_response(rec_str):
+    """
+    Wraps an already serialized JSON record in a response, skipping
+    the round trip through pyqremis and flask_restful's serialization.
+
+    Records are validated on their way into the storage backend, so
+    the stored JSON str can be handed to the client as is. If the client
+    negotiated another representation the record is decoded and handed
+    back to flask_restful to render instead.
+
+    __Args__
+
+    1. rec_str (str): The JSON str representing the record
+
+    __Returns__
+
+    * (flask.Response/dict): A response containing the record, or the
+        decoded record
+    """
+    if negotiated_mediatype() != "application/json":
+        return json_engine().loads(rec_str)
+    return Response(rec_str, mimetype="application/json", headers={"Vary": "Accept"})
+
+
+class JSONEngine:
+    """
+    A uniform interface over the supported JSON libraries, used both
+    for response bodies and for the records handed to the storage backend
+    """
+    def __init__(self, name="stdlib"):
+        """
+        __Args__
+
+        1. name (str): The JSON library to use, one of stdlib, orjson or ujson
+        """
+        self.name = name
+        if name == "stdlib":
+            self.dumps = dumps
+            self.loads = loads
+            self.item_separator, self.key_separator = ", ", ": "
+        elif name == "orjson":
+            if orjson is None:
+                raise ConfigError("The orjson JSON engine requires the orjson package!")
+            self.dumps = lambda x: orjson.dumps(x).decode("utf-8")
+            self.loads = orjson.loads
+            self.item_separator, self.key_separator = ",", ":"
+        elif name == "ujson":
+            if ujson is None:
+                raise ConfigError("The ujson JSON engine requires the ujson package!")
+            self.dumps = lambda x: ujson.dumps(x, escape_forward_slashes=False)
+            self.loads = ujson.loads
+            self.item_separator, self.key_separator = ",", ":"
+        else:
+            raise ConfigError(
+                "Invalid JSON engine! Valid options: stdlib, orjson, ujson"
+            )
+
+    def dumpb(self, obj):
+        """
+        Serializes obj to UTF-8 encoded JSON bytes
+
+        __Args__
+
+        1. obj: The object to serialize
+
+        __Returns__
+
+        * (bytes): The JSON document
+        """
+        if self.name == "orjson":
+            return orjson.dumps(obj)
+        return self.dumps(obj).encode("utf-8")
+
+
+default_json_engine = JSONEngine()
+
+
+def json_engine():
+    """
+    Returns the configured JSONEngine, falling back to the stdlib json module
+    """
+    return BLUEPRINT.config.get('json', default_json_engine)
+
+
+@API.representation('application/json')
+def output_json(data, code, headers=None):
+    engine = json_engine()
+    if engine.name == "stdlib":
+        # Keep flask_restful's handling of RESTFUL_JSON and debug indenting
+        resp = restful_output_json(data, code, headers)
+    else:
+        resp = make_response(engine.dumpb(data) + b"\n", code)
+        resp.headers.extend(headers or {})
+    resp.vary.add("Accept")
+    return resp
+
+
+if cbor2 is not None:
+    @API.representation('application/cbor')
+    def output_cbor(data, code, headers=None):
+        resp = make_response(cbor2.dumps(data), code)
+        resp.headers.extend(headers or {})
+        resp.vary.add("Accept")
+        return resp
+
+
+if msgpack is not None:
+    def output_msgpack(data, code, headers=None):
+        resp = make_response(msgpack.packb(data, use_bin_type=True), code)
+        resp.headers.extend(headers or {})
+        resp.vary.add("Accept")
+        return resp
+
+    API.representation('application/msgpack')(output_msgpack)
+    API.representation('application/x-msgpack')(output_msgpack)
+
+
+def negotiated_mediatype():
+    """
+    Returns the media type the current request's response will be rendered as
+    """
+    return request.accept_mimetypes.best_match(
+        API.representations, default=API.default_mediatype
+    )
+
+
+class Compressor:
+    """
+    A uniform, incremental interface over the supported compression codecs
+    """
+    def __init__(self, encoding, level=None):
+        """
+        __Args__
+
+        1. encoding (str): The content coding to produce, one of gzip, br or zstd
+        2. level (int/None): The compression level, or None for the codec default
+        """
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(
+                level if level is not None else 6, zlib.DEFLATED, 31
+            )
+            self._compress, self._flush = self._obj.compress, self._obj.flush
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=level if level is not None else 4)
+            self._compress, self._flush = self._obj.process, self._obj.finish
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(
+                level=level if level is not None else 3
+            ).compressobj()
+            self._compress, self._flush = self._obj.compress, self._obj.flush
+        else:
+            raise ValueError("Unsupported content coding: {}".format(encoding))
+
+    def compress(self, data):
+        return self._compress(data)
+
+    def flush(self):
+        return self._flush()
+
+
+def available_encodings():
+    """
+    Returns the configured content codings which can be produced, in
+    order of preference
+    """
+    installed = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    encodings = BLUEPRINT.config.get("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+    return [x.strip() for x in encodings.split(",") if installed.get(x.strip())]
+
+
+def compress_stream(chunks, compressor):
+    """
+    Incrementally compresses the body of a streamed response
+
+    __Args__
+
+    1. chunks (iterable): The response body, as str or bytes chunks
+    2. compressor (Compressor): The compressor to use
+    """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+@BLUEPRINT.after_request
+def compress_response(response):
+    if not BLUEPRINT.config.get("COMPRESSION"):
+        return response
+    if response.status_code < 200 or response.status_code in (204, 304) or \
+            "Content-Encoding" in response.headers:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+    compressor = Compressor(encoding, BLUEPRINT.config.get("COMPRESSION_LEVEL"))
+    if response.is_streamed:
+        response.response = compress_stream(response.response, compressor)
+        response.direct_passthrough = False
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < BLUEPRINT.config.get("COMPRESSION_MIN_SIZE", 500):
+            return response
+        response.set_data(compressor.compress(data) + compressor.flush())
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        # Strong ETags have to differ between content codings
+        response.set_etag(etag + "-" + encoding)
+    response.headers["Content-Encoding"] = encoding
+    return response
 
-class AgentLinkedRelationships(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
-        r = {}
-        q = BLUEPRINT.config['storage'].get_kind_links("relationship", id, args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['linkingRelationshipIdentifier_list'] = [
-            {'id': x, '_link': API.url_for(Relationship, id=x)}
-            for x in q[1]
-        ]
-        return r
 
-    def post(self, id):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("relationship_id", type=str, required=True)
-        args = parser.parse_args()
-        if not BLUEPRINT.config['storage'].record_exists("agent", id):
-            raise IdentifierDoesNotExistError(str(id))
-        if not BLUEPRINT.config['storage'].record_exists("relationship", args['relationship_id']):
-            raise IdentifierDoesNotExistError(str(args['relationship_id']))
-        BLUEPRINT.config['storage'].link_records("agent", id, "relationship", args['relationship_id'])
-        return id
+def linking_field(kind):
+    """
+    Returns the name of the field a record uses to link to ${kind} records
+
+    __Args__
+
+    1. kind (str): The kind of the linked records (see module record_kinds)
+
+    __Returns__
+
+    * (str): The field name, eg: linkingRelationshipIdentifier
+    """
+    return "linking{}Identifier".format(kind.capitalize())
+
+
+def splice_links(rec_str, links, extra=None):
+    """
+    Splices linking identifier arrays into a stored record
+
+    The output matches the JSON engine's dumps() of the record's to_dict() after
+    the links have been added one by one with add_linkingXIdentifier(),
+    without building a pyqremis object per link.
+
+    __Args__
+
+    1. rec_str (str): The JSON str representing the record, as stored
+    2. links ([(str, [str])]): (kind, identifiers) pairs, in the order
+        the linking fields should appear in the record
+    3. extra (dict/None): Further top level fields to append after the links
+
+    __Returns__
+
+    * (str): The JSON str representing the record, including its links
+    """
+    engine = json_engine()
+    item_sep, key_sep = engine.item_separator, engine.key_separator
+    entry = '{{"{0}Type"' + key_sep + '"uuid"' + item_sep + '"{0}Value"' + key_sep + '{1}}}'
+    fields = []
+    for kind, ids in links:
+        if not ids:
+            continue
+        field = linking_field(kind)
+        fields.append('"{}"{}[{}]'.format(
+            field, key_sep, item_sep.join(entry.format(field, engine.dumps(x)) for x in ids)
+        ))
+    for key, value in (extra or {}).items():
+        fields.append('"{}"{}{}'.format(key, key_sep, engine.dumps(value)))
+    if not fields:
+        return rec_str
+    head = rec_str.rstrip()
+    if not head.endswith("}"):
+        raise InvalidQremisRecordError("Stored record is not a JSON object")
+    head = head[:-1].rstrip()
+    sep = "" if head.endswith("{") else item_sep
+    return head + sep + item_sep.join(fields) + "}"
+
+
+def stream_links(rec_str, kind, id, limit=None, extra=None, batch_size=1000):
+    """
+    Streams a stored record with its links spliced in
+
+    Produces the same JSON as splice_links(), but the record's static
+    fields are emitted first and each link array is then written out as
+    it is read from a backend cursor, so the links are never all in
+    memory at once.
+
+    __Args__
+
+    1. rec_str (str): The JSON str representing the record, as stored
+    2. kind (str): The kind of the record
+    3. id (str): The identifier of the record
+    4. limit (int/None): The most links of each kind to include
+    5. extra (dict/None): Further top level fields to append after the links
+    6. batch_size (int): How many links to fetch, and write, at a time
+
+    __Returns__
+
+    * (iter): The JSON, as a series of strs
+    """
+    engine = json_engine()
+    item_sep, key_sep = engine.item_separator, engine.key_separator
+    entry = '{{"{0}Type"' + key_sep + '"uuid"' + item_sep + '"{0}Value"' + key_sep + '{1}}}'
+    head = rec_str.rstrip()
+    if not head.endswith("}"):
+        raise InvalidQremisRecordError("Stored record is not a JSON object")
+    head = head[:-1].rstrip()
+    empty = head.endswith("{")
+    yield head
+    for x in record_links[kind]:
+        field = linking_field(x)
+        ids = BLUEPRINT.config['storage'].iter_kind_links(x, id, batch_size)
+        if limit is not None:
+            ids = islice(ids, limit)
+        opened = False
+        for batch in iter(lambda: list(islice(ids, batch_size)), []):
+            entries = item_sep.join(entry.format(field, engine.dumps(y)) for y in batch)
+            if opened:
+                yield item_sep + entries
+                continue
+            yield ("" if empty else item_sep) + '"{}"{}['.format(field, key_sep) + entries
+            opened, empty = True, False
+        if opened:
+            yield "]"
+    for key, value in (extra or {}).items():
+        yield ("" if empty else item_sep) + '"{}"{}{}'.format(key, key_sep, engine.dumps(value))
+        empty = False
+    yield "}"
+
+
+def hydrate_record(rec, links):
+    """
+    Adds linking identifier arrays to a decoded record, in place
+
+    __Args__
+
+    1. rec (dict): The record, as decoded from storage
+    2. links ([(str, [str])]): (kind, identifiers) pairs, in the order
+        the linking fields should appear in the record
+
+    __Returns__
+
+    * (dict): The record
+    """
+    for kind, ids in links:
+        if not ids:
+            continue
+        field = linking_field(kind)
+        rec[field] = [{field + "Type": "uuid", field + "Value": x} for x in ids]
+    return rec
+
+
+def hydration_links(kind, ids):
+    """
+    Fetches the links to embed in the full records of several records
+
+    When HYDRATION_LIMIT is set at most that many links of each kind are
+    fetched per record, and a record with more links of a kind than were
+    embedded gets a truncation marker for that kind, pointing at the
+    linked${kind} listing which pages through all of them.
+
+    __Args__
+
+    1. kind (str): The kind of the records
+    2. ids ([str]): The identifiers of the records
+
+    __Returns__
+
+    * ({str: [(str, [str])]}, {str: dict}): The (kind, identifiers) pairs to
+        embed, keyed by identifier, and the '_truncated' marker of each
+        record which was not fully hydrated, keyed by identifier
+    """
+    storage = BLUEPRINT.config['storage']
+    limit = BLUEPRINT.config.get("HYDRATION_LIMIT") or None
+    links = {x: storage.get_kind_links_many(x, ids, limit) for x in record_links[kind]}
+    hydrated = {id: [(x, links[x][id]) for x in record_links[kind]] for id in ids}
+    truncated = {}
+    if limit is None:
+        return hydrated, truncated
+    for x in record_links[kind]:
+        for id in ids:
+            if len(links[x][id]) < limit:
+                continue
+            # Only records which filled their allowance need counting
+            total = storage.count_kind_links(x, id)
+            if total > len(links[x][id]):
+                truncated.setdefault(id, {})[linking_field(x)] = \
+                    truncation_marker(kind, id, x, len(links[x][id]), total)
+    return hydrated, truncated
+
+
+def truncation_marker(kind, id, linked, embedded, total):
+    """
+    Describes the links of one kind left out of a full record
+
+    __Args__
+
+    1. kind (str): The kind of the record
+    2. id (str): The identifier of the record
+    3. linked (str): The kind of the links
+    4. embedded (int): How many of the links were embedded
+    5. total (int): How many links the record has
+
+    __Returns__
+
+    * (dict): The marker, for the record's '_truncated' field
+    """
+    return {
+        "embedded": embedded,
+        "total": total,
+        "_link": API.url_for(kind_table[kind].linked_resources[linked], id=id)
+    }
 
 
-class RightsList(Resource):
-    def get(self):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
-        r = {}
-        q = BLUEPRINT.config['storage'].get_kind_list("rights", args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['rights_list'] = [{'id': x, '_link': API.url_for(Rights, id=x)}
-                            for x in q[1]]
-        return r
+def expand_items(kind, items, expand):
+    """
+    Inlines the records of a listing page into the listing
+
+    All of the page's records are fetched in one batched read (and their
+    links, when full records are requested, in one batched read per
+    linked kind, bounded by HYDRATION_LIMIT, see hydration_links()).
+
+    __Args__
+
+    1. kind (str): The kind of the listed records
+    2. items ([dict]): The listing, as {'id': ..., '_link': ...} dicts
+    3. expand (str/None): None, "sparse" or "full"
+
+    __Returns__
+
+    * ([dict]): The listing, with a 'record' added to each item. Identifiers
+        which do not resolve to a record get a 'record' of None.
+    """
+    if expand is None:
+        return items
+    if expand not in ("sparse", "full"):
+        raise UserError("expand must be one of: sparse, full")
+    ids = [x['id'] for x in items]
+    recs = BLUEPRINT.config['storage'].get_records(ids)
+    links, truncated = {}, {}
+    if expand == "full":
+        links, truncated = hydration_links(kind, ids)
+    for item, rec_str in zip(items, recs):
+        if rec_str is None:
+            item['record'] = None
+            continue
+        rec = json_engine().loads(rec_str)
+        if expand == "full":
+            hydrate_record(rec, links[item['id']])
+            if item['id'] in truncated:
+                rec['_truncated'] = truncated[item['id']]
+        item['record'] = rec
+    return items
+
+
+def link_template(resource):
+    """
+    Builds the URL of a record resource once, with a placeholder for the id
+
+    __Args__
+
+    1. resource (Resource): The record resource, eg: Object
+
+    __Returns__
+
+    * (str, str): The URL before and after the identifier
+    """
+    placeholder = "__id__"
+    prefix, suffix = API.url_for(resource, id=placeholder).split(placeholder)
+    return prefix, suffix
+
+
+def listing(r, key, kind, resource, ids, args):
+    """
+    Renders the identifiers of a listing page into a response
+
+    Links are built by concatenating each identifier onto a prefix computed
+    once per page, rather than calling API.url_for() per identifier. In
+    compact mode the listing is a bare list of identifiers, and the page
+    carries a single '_link_template' instead.
+
+    __Args__
+
+    1. r (dict): The response being built
+    2. key (str): The key to store the listing under
+    3. kind (str): The kind of the listed records
+    4. resource (Resource): The resource serving the listed records
+    5. ids ([str]): The identifiers on the page
+    6. args (dict): The parsed pagination arguments
+    """
+    prefix, suffix = link_template(resource)
+    if args['compact']:
+        if args['expand'] is not None:
+            raise UserError("compact listings can not be expanded")
+        r[key] = ids
+        r['_link_template'] = prefix + "{id}" + suffix
+        return
+    items = []
+    for x in ids:
+        if unreserved_id_pattern.match(x):
+            items.append({'id': x, '_link': prefix + x + suffix})
+        else:
+            items.append({'id': x, '_link': API.url_for(resource, id=x)})
+    r[key] = expand_items(kind, items, args['expand'])
+
+
+def conditional_get(id, view, *args, generation=None):
+    """
+    Computes the ETag of a record view and checks it against If-None-Match
+
+    ETags are derived from the record's link generation, which the
+    storage backend maintains, so nothing needs to be hydrated to
+    answer a conditional request.
+
+    __Args__
+
+    1. id (str): The identifier of the record
+    2. view (str): A name for the view of the record being requested
+    3. *args: Any further request arguments the view depends on
+    4. generation (int/None): The generation, if the caller already has
+        it (or if it isn't the record's, eg: for a kind listing)
+
+    __Returns__
+
+    * (str/None, flask.Response/None): The ETag (or None if conditional
+        GETs are disabled) and a 304 response if the client's copy is current
+    """
+    if not BLUEPRINT.config.get("CONDITIONAL_GETS"):
+        return None, None
+    if generation is None:
+        generation = BLUEPRINT.config['storage'].get_generation(id)
+    etag = "-".join(
+        [view, str(generation)] +
+        [str(x) for x in args] +
+        [negotiated_mediatype().split("/")[-1]]
+    )
+    # Identifiers which were never stored are at generation 0, so the
+    # client's copy can't be vouched for
+    if generation == 0:
+        return etag, None
+    # Compressed responses carry the content coding in their ETag
+    for candidate in [etag] + [etag + "-" + x for x in ("gzip", "br", "zstd")]:
+        if request.if_none_match.contains_weak(candidate):
+            response = Response(status=304)
+            response.set_etag(candidate)
+            response.vary.add("Accept")
+            return etag, response
+    return etag, None
+
+
+def with_etag(result, etag):
+    """
+    Attaches an ETag computed by conditional_get() to a resource's result
+
+    __Args__
+
+    1. result (flask.Response/dict): The resource's result
+    2. etag (str/None): The ETag, or None
+
+    __Returns__
+
+    * The result, in a form flask_restful will attach the ETag to
+    """
+    if etag is None:
+        return result
+    if isinstance(result, Response):
+        result.set_etag(etag)
+        return result
+    return result, 200, {"ETag": quote_etag(etag)}
+
+
+def merge_patch(target, patch):
+    """
+    Applies a JSON Merge Patch (RFC 7396)
+
+    __Args__
+
+    1. target: The document to patch, as decoded from JSON. It is not modified.
+    2. patch: The patch, as decoded from JSON
+
+    __Returns__
+
+    * The patched document
+    """
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def merge_diff(old, new):
+    """
+    Computes the smallest JSON Merge Patch turning one document into another
+
+    __Args__
+
+    1. old (dict): The original document
+    2. new (dict): The changed document
+
+    __Returns__
+
+    * (dict): The patch, which is empty if the documents are equal
+    """
+    patch = {}
+    for key in old:
+        if key not in new:
+            patch[key] = None
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif old[key] != value:
+            if isinstance(old[key], dict) and isinstance(value, dict):
+                patch[key] = merge_diff(old[key], value)
+            else:
+                patch[key] = value
+    return patch
+
+
+def cached_page(key, generation, build):
+    """
+    Returns a listing page from the list page cache, or builds and caches it
+
+    Pages are cached under the generation they were built at, so bumping
+    a generation in the storage backend invalidates every page built
+    under it, and the stale pages age out of the cache.
+
+    __Args__
+
+    1. key (tuple): Everything the page depends on
+    2. generation (int): The current generation of what is being listed
+    3. build (callable): Builds the page
+
+    __Returns__
+
+    * (dict): The page
+    """
+    cache = BLUEPRINT.config.get('list_cache')
+    if cache is None:
+        return build()
+    key = key + (generation,)
+    r = cache.get(key)
+    if r is None:
+        r = build()
+        cache.put(key, r, len(json_engine().dumps(r)))
+    return r
+
+
+class RecordKind:
+    """
+    Everything the generic resources need to know about one kind of
+    record, computed once at import
+    """
+    def __init__(self, name, plural):
+        """
+        __Args__
 
-    def post(self):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("record", type=str, required=True)
-        args = parser.parse_args()
+        1. name (str): The kind of record (see module record_kinds)
+        2. plural (str): The capitalized plural, as used in linked${kind} URLs
+        """
+        self.name = name
+        self.title = name.capitalize()
+        self.plural = plural
+        self.links = record_links[name]
+        self.model = getattr(pyqremis, self.title)
+        self.link_model = getattr(pyqremis, "Linking" + self.title + "Identifier")
+        self.id_field = name + "Identifier"
+        self.linking_field = linking_field(name)
+        self.list_key = name + "_list"
+        self.path = "/" + name + "_list"
+        # The parser for requests linking a record of this kind to another record
+        self.link_args_parser = reqparse.RequestParser()
+        self.link_args_parser.add_argument(name + "_id", type=str, required=True)
+        # Filled in as the resources are built, see make_resources()
+        self.list_resource = None
+        self.record_resource = None
+        self.sparse_resource = None
+        self.count_resource = None
+        self.degree_resource = None
+        self.linked_resources = {}
+
+    def from_json(self, rec_str):
+        """
+        Parses a JSON str into a pyqremis record of this kind
+        """
         try:
-            rec = pyqremis.Rights.from_dict(loads(args['record']))
+            return self.model.from_dict(json_engine().loads(rec_str))
         except Exception as e:
             raise InvalidQremisRecordError(str(e))
-        rightsId = None
-        for x in rec.get_rightsIdentifier():
-            if x.get_rightsIdentifierType() == "uuid":
-                rightsId = x.get_rightsIdentifierValue()
-        if rightsId is None:
-            raise MissingQremisUUIDIdentifierError()
-        relationships_to_link = []
+
+    def get_uuid(self, rec):
+        """
+        Returns the uuid identifier of a pyqremis record of this kind, or None
+        """
+        recId = None
+        for x in getattr(rec, "get_" + self.id_field)():
+            if getattr(x, "get_" + self.id_field + "Type")() == "uuid":
+                recId = getattr(x, "get_" + self.id_field + "Value")()
+        return recId
+
+    def pop_links(self, rec, linked):
+        """
+        Removes the links to ${linked} records from a pyqremis record of
+        this kind, returning their identifiers
+        """
+        ids = []
         try:
-            for x in rec.get_linkingRelationshipIdentifier():
-                if x.get_linkingRelationshipIdentifierType() == "uuid":
-                    relationships_to_link.append(x.get_linkingRelationshipIdentifierValue())
+            for x in getattr(rec, "get_" + linked.linking_field)():
+                if getattr(x, "get_" + linked.linking_field + "Type")() == "uuid":
+                    ids.append(getattr(x, "get_" + linked.linking_field + "Value")())
                 else:
                     raise MissingQremisUUIDIdentifierError()
-            rec.del_linkingRelationshipIdentifier()
+            getattr(rec, "del_" + linked.linking_field)()
         except KeyError:
             pass
-        BLUEPRINT.config['storage'].add_record("rights", rightsId, dumps(rec.to_dict()))
-        for x in relationships_to_link:
-            BLUEPRINT.config['storage'].link_records(
-                "rights", rightsId, "relationship", x
-            )
-        r = {}
-        r['_link'] = API.url_for(Rights, id=rightsId)
-        r['id'] = rightsId
-        return r
+        return ids
 
+    def add_links(self, rec, linked, ids):
+        """
+        Adds links to ${linked} records to a pyqremis record of this kind
+        """
+        add = getattr(rec, "add_" + linked.linking_field)
+        for x in ids:
+            add(linked.link_model(**{
+                linked.linking_field + "Type": "uuid",
+                linked.linking_field + "Value": x
+            }))
 
-class Rights(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        rec_str = BLUEPRINT.config['storage'].get_record(id)
+
+record_args_parser = reqparse.RequestParser()
+record_args_parser.add_argument("record", type=str, required=True)
+
+
+def store_record(kind, recId, rec_str, links):
+    """
+    Adds a validated record to the storage backend and links it
+
+    __Args__
+
+    1. kind (str): The kind of record (see module record_kinds)
+    2. recId (str): The identifier of the record
+    3. rec_str (str): The JSON str representing the record, without links
+    4. links ({str: [str]}): The identifiers to link the record to, by kind
+    """
+    BLUEPRINT.config['storage'].add_record(kind, recId, rec_str)
+    pairs = link_pairs(kind, recId, links)
+    if pairs:
+        BLUEPRINT.config['storage'].link_records_many(pairs)
+
+
+def link_pairs(kind, recId, links):
+    """
+    Lists the link_records() arguments linking a record to others
+
+    __Args__
+
+    1. kind (str): The kind of record (see module record_kinds)
+    2. recId (str): The identifier of the record
+    3. links ({str: [str]}): The identifiers to link the record to, by kind
+
+    __Returns__
+
+    * ([(str, str, str, str)]): The (kind1, id1, kind2, id2) of each link
+    """
+    pairs = []
+    for linked_kind, ids in links.items():
+        for x in ids:
+            # link_records() takes the relationship as its second record
+            if kind == "relationship":
+                pairs.append((linked_kind, x, kind, recId))
+            else:
+                pairs.append((kind, recId, linked_kind, x))
+    return pairs
+
+
+def prepare_model(kind, record):
+    """
+    Validates a record with pyqremis
+
+    __Args__
+
+    1. kind (RecordKind): The kind of record
+    2. record (str): The JSON str representing the record
+
+    __Returns__
+
+    * (str, str, {str: [str]}): The identifier of the record, the JSON
+        str to store, without links, and the identifiers to link it to
+    """
+    rec = kind.from_json(record)
+    recId = kind.get_uuid(rec)
+    if recId is None:
+        raise MissingQremisUUIDIdentifierError()
+    links = {x: kind.pop_links(rec, kind_table[x]) for x in kind.links}
+    return recId, json_engine().dumps(rec.to_dict()), links
+
+
+def ingest_model(kind, record):
+    """
+    Validates a record with pyqremis, then stores and links it
+
+    __Args__
+
+    1. kind (RecordKind): The kind of record
+    2. record (str): The JSON str representing the record
+
+    __Returns__
+
+    * (str): The identifier of the stored record
+    """
+    recId, rec_str, links = prepare_model(kind, record)
+    store_record(kind.name, recId, rec_str, links)
+    return recId
+
+
+class IngestQueue:
+    """
+    A durable queue of validated records waiting to be stored, kept in
+    a SQLite database, with the background workers which drain it
+
+    Every process sharing the database file may enqueue and drain. Rows
+    are claimed in batches, and a claim which isn't completed within
+    lease seconds (eg: its worker died) is claimed again. A record which
+    fails to store max_attempts times is given up on.
+
+    A ticket moves through "queued", "storing", and then "stored" or
+    "failed". Once it is "stored" its record, and all of its links, are
+    readable through every process.
+
+    __Args__
+
+    1. path (str): The database file
+    2. workers (int): The number of worker threads per process
+    3. batch_size (int): The most records a worker stores at once
+    4. interval (int/float): Seconds a worker sleeps when the queue is empty
+    5. lease (int/float): Seconds after which a claim may be claimed again
+    6. retention (int/float): Seconds to keep the status of completed tickets
+    7. max_attempts (int): The most times to try storing a record
+    """
+    def __init__(self, path, workers=1, batch_size=100, interval=0.1, lease=60, retention=86400,
+                 max_attempts=5):
+        self.path = path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self.retention = retention
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.pid = None
+        with self.connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS queue (" +
+                "ticket INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, " +
+                "id TEXT NOT NULL, rec TEXT NOT NULL, links TEXT NOT NULL, " +
+                "state TEXT NOT NULL, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, " +
+                "updated REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS queue_state ON queue (state, ticket)")
+            # An identifier may only be pending once
+            db.execute("CREATE UNIQUE INDEX IF NOT EXISTS queue_pending ON queue (id) " +
+                       "WHERE state IN ('queued', 'storing')")
+
+    @contextmanager
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
         try:
-            rec = pyqremis.Rights.from_dict(loads(rec_str))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        for x in BLUEPRINT.config['storage'].get_kind_links("relationship", id, "0", None)[1]:
-            rec.add_linkingRelationshipIdentifier(
-                pyqremis.LinkingRelationshipIdentifier(
-                    linkingRelationshipIdentifierType="uuid",
-                    linkingRelationshipIdentifierValue=x
+            db.execute("PRAGMA synchronous=FULL")
+            yield db
+        finally:
+            db.close()
+
+    def put(self, kind, id, rec, links):
+        """
+        Durably enqueues a validated record
+
+        __Args__
+
+        1. kind (str): The kind of record (see module record_kinds)
+        2. id (str): The identifier of the record
+        3. rec (str): The JSON str representing the record, without links
+        4. links ({str: [str]}): The identifiers to link the record to, by kind
+
+        __Returns__
+
+        * (int): The ticket of the record
+        """
+        with self.connect() as db:
+            try:
+                cursor = db.execute(
+                    "INSERT INTO queue (kind, id, rec, links, state, updated) " +
+                    "VALUES (?, ?, ?, ?, 'queued', ?)",
+                    (kind, id, rec, dumps(links), time.time())
                 )
+            except sqlite3.IntegrityError:
+                raise DuplicateIdentifierError("Identifier {} already exists".format(str(id)))
+            return cursor.lastrowid
+
+    def claim(self, max_size):
+        """
+        Claims the oldest queued records, and any whose claim has lapsed
+
+        __Args__
+
+        1. max_size (int): The most records to claim
+
+        __Returns__
+
+        * ([(int, str, str, str, {str: [str]}, int)]): The ticket, kind,
+            identifier, record, links and number of failed attempts to
+            store each record, counting lapsed claims
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT ticket, kind, id, rec, links, attempts, state FROM queue " +
+                "WHERE state = 'queued' OR (state = 'storing' AND updated < ?) " +
+                "ORDER BY ticket LIMIT ?",
+                (now - self.lease, max_size)
+            ).fetchall()
+            db.executemany(
+                "UPDATE queue SET attempts = attempts + (state = 'storing'), " +
+                "state = 'storing', updated = ? WHERE ticket = ?",
+                [(now, x[0]) for x in rows]
             )
-        return rec.to_dict()
+            db.execute("COMMIT")
+        return [(ticket, kind, id, rec, loads(links), attempts + (state == 'storing'))
+                for ticket, kind, id, rec, links, attempts, state in rows]
 
+    def complete(self, tickets, error=None):
+        """
+        Marks claimed records as stored, or as failed
 
-class SparseRights(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        rec_str = BLUEPRINT.config['storage'].get_record(id)
+        __Args__
+
+        1. tickets ([int]): The tickets of the records
+        2. error (Error/None): Why the records failed, or None if they were stored
+        """
+        with self.connect() as db:
+            db.executemany(
+                "UPDATE queue SET state = ?, error = ?, updated = ? WHERE ticket = ?",
+                [("stored" if error is None else "failed",
+                  None if error is None else dumps(error.to_dict()),
+                  time.time(), x) for x in tickets]
+            )
+
+    def release(self, tickets, failed=False):
+        """
+        Returns claimed records to the queue, to be retried
+
+        __Args__
+
+        1. tickets ([int]): The tickets of the records
+        2. failed (bool): Whether to count the claim as a failed attempt
+        """
+        with self.connect() as db:
+            db.executemany(
+                "UPDATE queue SET state = 'queued', attempts = attempts + ?, updated = ? " +
+                "WHERE ticket = ?",
+                [(int(failed), time.time(), x) for x in tickets]
+            )
+
+    def status(self, ticket):
+        """
+        __Returns__
+
+        * (dict/None): The kind, identifier, state and error of a ticket,
+            or None if there is no such ticket
+        """
+        with self.connect() as db:
+            row = db.execute("SELECT kind, id, state, error FROM queue WHERE ticket = ?",
+                             (ticket,)).fetchone()
+        if row is None:
+            return None
+        return {"kind": row[0], "id": row[1], "state": row[2],
+                "error": loads(row[3]) if row[3] is not None else None}
+
+    def prune(self):
+        with self.connect() as db:
+            db.execute("DELETE FROM queue WHERE state IN ('stored', 'failed') AND updated < ?",
+                       (time.time() - self.retention,))
+
+    def stats(self):
+        with self.connect() as db:
+            counts = dict(db.execute("SELECT state, COUNT(*) FROM queue GROUP BY state").fetchall())
+        return {x: counts.get(x, 0) for x in ["queued", "storing", "stored", "failed"]}
+
+    def start(self):
+        """
+        Starts this process' worker threads, if they aren't running
+
+        Threads don't survive a fork, so a forked worker process starts
+        its own on its first request.
+        """
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            for _ in range(self.workers):
+                threading.Thread(target=self.work, daemon=True).start()
+
+    def work(self):
+        pruned = 0
+        while True:
+            try:
+                if not drain_ingest_queue(self, BLUEPRINT.config['storage'], self.batch_size,
+                                          self.max_attempts):
+                    if time.monotonic() - pruned > 60:
+                        self.prune()
+                        pruned = time.monotonic()
+                    time.sleep(self.interval)
+            except Exception:
+                log.exception("Failed to drain the ingest queue")
+                time.sleep(self.interval)
+
+
+def add_queued_record(storage, kind, id, rec, retry):
+    """
+    Adds a queued record, unless it was already added by an earlier attempt
+
+    __Args__
+
+    1. storage (StorageBackend): The backend to store the record in
+    2. kind (str): The kind of record
+    3. id (str): The identifier of the record
+    4. rec (str): The JSON str representing the record
+    5. retry (bool): Whether the record may have been added already
+    """
+    try:
+        storage.add_record(kind, id, rec)
+    except DuplicateIdentifierError:
+        if not retry or storage.get_record(id) != rec:
+            raise
+
+
+def drain_ingest_queue(queue, storage, batch_size=100, max_attempts=5):
+    """
+    Stores and links one batch of queued records
+
+    The records are added one by one, then all of their links are made
+    with one link_records_many() call. A record isn't marked stored until
+    its links are.
+
+    If the batch fails its records are stored one at a time, so that one
+    bad record doesn't hold back the rest. A record which fails because
+    the backend is unavailable is released back to the queue, to be
+    retried. One which is invalid, or has failed max_attempts times, is
+    marked failed.
+
+    __Args__
+
+    1. queue (IngestQueue): The queue to drain
+    2. storage (StorageBackend): The backend to store the records in
+    3. batch_size (int): The most records to store
+    4. max_attempts (int): The most times to try storing a record
+
+    __Returns__
+
+    * (int): The number of records claimed
+    """
+    rows = queue.claim(batch_size)
+    failed = set()
+    pairs = []
+    try:
+        for ticket, kind, id, rec, links, attempts in rows:
+            try:
+                # A reclaimed record may have been added before its
+                # previous claim lapsed, in which case it only needs linking
+                add_queued_record(storage, kind, id, rec, attempts > 0)
+            except UserError as e:
+                queue.complete([ticket], e)
+                failed.add(ticket)
+                continue
+            pairs.extend(link_pairs(kind, id, links))
+        if pairs:
+            storage.link_records_many(pairs)
+    except Exception:
+        log.exception("Failed to store a batch of queued records, storing them one at a time")
+    else:
+        queue.complete([x[0] for x in rows if x[0] not in failed])
+        return len(rows)
+    unavailable = None
+    for ticket, kind, id, rec, links, attempts in rows:
+        if ticket in failed:
+            continue
+        try:
+            # The failed batch may have added the record already
+            add_queued_record(storage, kind, id, rec, True)
+            pairs = link_pairs(kind, id, links)
+            if pairs:
+                storage.link_records_many(pairs)
+        except (ServiceUnavailableError,) + PolicyStorageBackend.transient_errors as e:
+            queue.release([ticket])
+            unavailable = e
+        except UserError as e:
+            queue.complete([ticket], e)
+        except Exception as e:
+            if attempts + 1 >= max_attempts:
+                log.exception("Giving up on queued record {}".format(id))
+                queue.complete([ticket], e if isinstance(e, Error) else ServerError(str(e)))
+            else:
+                queue.release([ticket], failed=True)
+        else:
+            queue.complete([ticket])
+    if unavailable is not None:
+        # Let the worker back off until the backend returns
+        raise unavailable
+    return len(rows)
+
+
+@BLUEPRINT.before_app_request
+def start_ingest_workers():
+    if BLUEPRINT.config.get('ingest_queue') is not None:
+        BLUEPRINT.config['ingest_queue'].start()
+
+
+patch_args_parser = reqparse.RequestParser()
+patch_args_parser.add_argument("patch", type=str, required=True)
+
+
+def patch_record(kind, id, patch):
+    """
+    Applies a JSON Merge Patch to a stored record
+
+    Only the patched record is validated, and it is written back with a
+    compare and swap, so a concurrent change is never overwritten.
+
+    __Args__
+
+    1. kind (RecordKind): The kind of record
+    2. id (str): The identifier of the record
+    3. patch (str): The JSON Merge Patch, as a JSON str
+
+    __Returns__
+
+    * (dict): The effective patch, which is empty if nothing changed
+    """
+    storage = BLUEPRINT.config['storage']
+    if not storage.record_exists(kind.name, id):
+        raise IdentifierDoesNotExistError(str(id))
+    try:
+        patch = json_engine().loads(patch)
+    except Exception as e:
+        raise UserError("The patch is not valid JSON: {}".format(str(e)))
+    if not isinstance(patch, dict):
+        raise UserError("The patch must be a JSON object")
+    if kind.id_field in patch:
+        raise UserError("A patch can not change a record's identifiers")
+    for x in kind.links:
+        if kind_table[x].linking_field in patch:
+            raise UserError("Links are added through the linked{} endpoint".format(
+                kind_table[x].plural
+            ))
+    old_str = storage.get_record(id)
+    old = json_engine().loads(old_str)
+    new = merge_patch(old, patch)
+    if BLUEPRINT.config.get('validator') is not None:
+        new = BLUEPRINT.config['validator'].validate(kind.name, new)[2]
+    else:
         try:
-            rec = pyqremis.Rights.from_dict(loads(rec_str))
+            new = kind.model.from_dict(new).to_dict()
         except Exception as e:
             raise InvalidQremisRecordError(str(e))
-        return rec.to_dict()
+    effective = merge_diff(old, new)
+    if not effective:
+        return effective
+    if not storage.replace_record(kind.name, id, old_str, json_engine().dumps(new)):
+        raise ConflictError("Record {} changed while it was being patched".format(str(id)))
+    return effective
 
 
-class RightsLinkedRelationships(Resource):
-    def get(self, id):
+class KindList(Resource):
+    kind = None
+
+    def get(self):
         log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
+        args = pagination_args_parser.parse_args()
+        limit = check_limit(args['limit'])
+        if args['expand'] is not None or not (BLUEPRINT.config.get("CONDITIONAL_GETS") or
+                                              BLUEPRINT.config.get('list_cache') is not None):
+            # Expanded pages change with the listed records, not just the listing
+            return self.page(args, limit)
+        generation = BLUEPRINT.config['storage'].get_kind_generation(self.kind.name)
+        view = (args['cursor'], limit, args['compact'], args['total'])
+        etag, not_modified = conditional_get(self.kind.name, "list", *view, generation=generation)
+        if not_modified is not None:
+            return not_modified
+        r = cached_page((self.kind.name, "list") + view, generation, lambda: self.page(args, limit))
+        return with_etag(r, etag)
+
+    def page(self, args, limit):
+        q = BLUEPRINT.config['storage'].get_kind_list(self.kind.name, args['cursor'], limit)
         r = {}
-        q = BLUEPRINT.config['storage'].get_kind_links("relationship", id, args['cursor'], check_limit(args['limit']))
         r['pagination'] = {}
         r['pagination']['starting_cursor'] = args['cursor']
         r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['linkingRelationshipIdentifier_list'] = [
-            {'id': x, '_link': API.url_for(Relationship, id=x)}
-            for x in q[1]
-        ]
+        r['pagination']['limit'] = limit
+        if args['total']:
+            r['pagination']['total'] = BLUEPRINT.config['storage'].count_kind(self.kind.name)
+        listing(r, self.kind.list_key, self.kind.name, self.kind.record_resource, q[1], args)
         return r
 
-    def post(self, id):
+    def post(self):
         log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("relationship_id", type=str, required=True)
-        args = parser.parse_args()
-        if not BLUEPRINT.config['storage'].record_exists("rights", id):
-            raise IdentifierDoesNotExistError(str(id))
-        if not BLUEPRINT.config['storage'].record_exists("relationship", args['relationship_id']):
-            raise IdentifierDoesNotExistError(str(args['relationship_id']))
-        BLUEPRINT.config['storage'].link_records("rights", id, "relationship", args['relationship_id'])
-        return id
+        args = record_args_parser.parse_args()
+        queue = BLUEPRINT.config.get('ingest_queue')
+        if queue is None:
+            if BLUEPRINT.config.get('validator') is not None:
+                recId = ingest_validated(self.kind.name, args['record'])
+            else:
+                recId = ingest_model(self.kind, args['record'])
+            r = {}
+            r['_link'] = API.url_for(self.kind.record_resource, id=recId)
+            r['id'] = recId
+            return r
+        if BLUEPRINT.config.get('validator') is not None:
+            recId, rec_str, links = prepare_validated(self.kind.name, args['record'])
+        else:
+            recId, rec_str, links = prepare_model(self.kind, args['record'])
+        if BLUEPRINT.config['storage'].record_exists(self.kind.name, recId):
+            raise DuplicateIdentifierError("Identifier {} already exists".format(str(recId)))
+        ticket = queue.put(self.kind.name, recId, rec_str, links)
+        r = {}
+        r['_link'] = API.url_for(self.kind.record_resource, id=recId)
+        r['id'] = recId
+        r['status'] = API.url_for(IngestStatus, ticket=ticket)
+        return r, 202, {"Location": r['status']}
 
 
-class RelationshipList(Resource):
-    def get(self):
+class Record(Resource):
+    kind = None
+
+    def get(self, id):
         log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
+        etag, not_modified = conditional_get(id, "full")
+        if not_modified is not None:
+            record_access(self.kind.name, id)
+            return not_modified
+        rec_str = BLUEPRINT.config['storage'].get_record(id)
+        record_access(self.kind.name, id)
+        threshold = BLUEPRINT.config.get("STREAM_THRESHOLD")
+        if threshold is not None and negotiated_mediatype() == "application/json":
+            # Fetching up to the threshold of each kind of link either shows
+            # the record is worth streaming, or gets all of its links
+            probed = [(x, BLUEPRINT.config['storage'].get_kind_links_many(x, [id], threshold)[id])
+                      for x in record_links[self.kind.name]]
+            truncated = self.truncated(id, probed, threshold)
+            if sum(len(ids) for x, ids in probed) >= threshold:
+                return with_etag(self.stream(id, rec_str, truncated), etag)
+            limit = BLUEPRINT.config.get("HYDRATION_LIMIT") or None
+            links = [(x, ids[:limit]) for x, ids in probed]
+        else:
+            links, truncated = hydration_links(self.kind.name, [id])
+            links, truncated = links[id], truncated.get(id)
+        extra = {"_truncated": truncated} if truncated else None
+        if BLUEPRINT.config.get("SPLICE_LINKS"):
+            return with_etag(passthrough_response(splice_links(rec_str, links, extra)), etag)
+        rec = self.kind.from_json(rec_str)
+        for x, ids in links:
+            self.kind.add_links(rec, kind_table[x], ids)
+        r = rec.to_dict()
+        r.update(extra or {})
+        return with_etag(r, etag)
+
+    def patch(self, id):
+        log.debug("PATCH received @ {}".format(self.__class__.__name__))
+        args = patch_args_parser.parse_args()
         r = {}
-        q = BLUEPRINT.config['storage'].get_kind_list("relationship", args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['relationship_list'] = [
-            {'id': x, '_link': API.url_for(Relationship, id=x)}
-            for x in q[1]
-        ]
+        r['_link'] = API.url_for(self.kind.record_resource, id=id)
+        r['id'] = id
+        r['patch'] = patch_record(self.kind, id, args['patch'])
         return r
 
-    def post(self):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("record", type=str, required=True)
-        args = parser.parse_args()
-        try:
-            rec = pyqremis.Relationship.from_dict(loads(args['record']))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        relationshipId = None
-        for x in rec.get_relationshipIdentifier():
-            if x.get_relationshipIdentifierType() == "uuid":
-                relationshipId = x.get_relationshipIdentifierValue()
-        if relationshipId is None:
-            raise MissingQremisUUIDIdentifierError()
-
-        objects_to_link = []
-        try:
-            for x in rec.get_linkingObjectIdentifier():
-                if x.get_linkingObjectIdentifierType() == "uuid":
-                    objects_to_link.append(x.get_linkingObjectIdentifierValue())
-                else:
-                    raise MissingQremisUUIDIdentifierError()
-            rec.del_linkingObjectIdentifier()
-        except KeyError:
-            pass
-
-        events_to_link = []
-        try:
-            for x in rec.get_linkingEventIdentifier():
-                if x.get_linkingEventIdentifierType() == "uuid":
-                    events_to_link.append(x.get_linkingEventIdentifierValue())
-                else:
-                    raise MissingQremisUUIDIdentifierError()
-            rec.del_linkingEventIdentifier()
-        except KeyError:
-            pass
+    def truncated(self, id, links, threshold):
+        """
+        Builds the truncation markers of a record whose links were fetched
+        up to threshold of each kind
 
-        agents_to_link = []
-        try:
-            for x in rec.get_linkingAgentIdentifier():
-                if x.get_linkingAgentIdentifierType() == "uuid":
-                    agents_to_link.append(x.get_linkingAgentIdentifierValue())
-                else:
-                    raise MissingQremisUUIDIdentifierError()
-            rec.del_linkingAgentIdentifier()
-        except KeyError:
-            pass
+        Only kinds which filled the threshold may have more links than
+        were fetched, so only those are counted.
 
-        rights_to_link = []
-        try:
-            for x in rec.get_linkingRightsIdentifier():
-                if x.get_linkingRightsIdentifierType() == "uuid":
-                    rights_to_link.append(x.get_linkingRightsIdentifierValue())
-                else:
-                    raise MissingQremisUUIDIdentifierError()
-            rec.del_linkingRightsIdentifier()
-        except KeyError:
-            pass
+        __Args__
 
-        BLUEPRINT.config['storage'].add_record("relationship", relationshipId, dumps(rec.to_dict()))
-        for x in objects_to_link:
-            BLUEPRINT.config['storage'].link_records(
-                "object", x, "relationship", relationshipId
-            )
-        for x in events_to_link:
-            BLUEPRINT.config['storage'].link_records(
-                "event", x, "relationship", relationshipId
-            )
-        for x in agents_to_link:
-            BLUEPRINT.config['storage'].link_records(
-                "agent", x, "relationship", relationshipId
-            )
-        for x in rights_to_link:
-            BLUEPRINT.config['storage'].link_records(
-                "rights", x, "relationship", relationshipId
-            )
+        1. id (str): The identifier of the record
+        2. links ([(str, [str])]): The (kind, identifiers) pairs fetched
+        3. threshold (int): The most links of each kind fetched
 
-        r = {}
-        r['_link'] = API.url_for(Relationship, id=relationshipId)
-        r['id'] = relationshipId
-        return r
+        __Returns__
 
+        * (dict): The truncation marker of each linking field which
+            HYDRATION_LIMIT cuts short
+        """
+        limit = BLUEPRINT.config.get("HYDRATION_LIMIT") or None
+        truncated = {}
+        if limit is None:
+            return truncated
+        for x, ids in links:
+            total = len(ids)
+            if total >= threshold:
+                total = BLUEPRINT.config['storage'].count_kind_links(x, id)
+            if total > limit:
+                truncated[linking_field(x)] = truncation_marker(self.kind.name, id, x, limit, total)
+        return truncated
+
+    def stream(self, id, rec_str, truncated):
+        """
+        Streams a record, writing its links out as they are read
 
-class Relationship(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        rec_str = BLUEPRINT.config['storage'].get_record(id)
-        try:
-            rec = pyqremis.Relationship.from_dict(loads(rec_str))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
+        __Args__
 
-        for x in BLUEPRINT.config['storage'].get_kind_links("object", id, "0", None)[1]:
-            rec.add_linkingObjectIdentifier(
-                pyqremis.LinkingObjectIdentifier(
-                    linkingObjectIdentifierType="uuid",
-                    linkingObjectIdentifierValue=x
-                )
-            )
+        1. id (str): The identifier of the record
+        2. rec_str (str): The JSON str representing the record, as stored
+        3. truncated (dict): The record's truncation markers
 
-        for x in BLUEPRINT.config['storage'].get_kind_links("agent", id, "0", None)[1]:
-            rec.add_linkingAgentIdentifier(
-                pyqremis.LinkingAgentIdentifier(
-                    linkingAgentIdentifierType="uuid",
-                    linkingAgentIdentifierValue=x
-                )
-            )
+        __Returns__
 
-        for x in BLUEPRINT.config['storage'].get_kind_links("event", id, "0", None)[1]:
-            rec.add_linkingEventIdentifier(
-                pyqremis.LinkingEventIdentifier(
-                    linkingEventIdentifierType="uuid",
-                    linkingEventIdentifierValue=x
-                )
-            )
+        * (flask.Response): The streamed response
+        """
+        limit = BLUEPRINT.config.get("HYDRATION_LIMIT") or None
+        extra = {"_truncated": truncated} if truncated else None
+        return Response(
+            stream_links(rec_str, self.kind.name, id, limit, extra),
+            mimetype="application/json", headers={"Vary": "Accept"}
+        )
 
-        for x in BLUEPRINT.config['storage'].get_kind_links("rights", id, "0", None)[1]:
-            rec.add_linkingRightsIdentifier(
-                pyqremis.LinkingRightsIdentifier(
-                    linkingRightsIdentifierType="uuid",
-                    linkingRightsIdentifierValue=x
-                )
-            )
-        return rec.to_dict()
 
+class SparseRecord(Resource):
+    kind = None
 
-class SparseRelationship(Resource):
     def get(self, id):
         log.debug("GET received @ {}".format(self.__class__.__name__))
+        etag, not_modified = conditional_get(id, "sparse")
+        if not_modified is not None:
+            record_access(self.kind.name, id)
+            return not_modified
         rec_str = BLUEPRINT.config['storage'].get_record(id)
-        try:
-            rec = pyqremis.Relationship.from_dict(loads(rec_str))
-        except Exception as e:
-            raise InvalidQremisRecordError(str(e))
-        return rec.to_dict()
+        record_access(self.kind.name, id)
+        if BLUEPRINT.config.get("SPARSE_PASSTHROUGH"):
+            return with_etag(passthrough_response(rec_str), etag)
+        return with_etag(self.kind.from_json(rec_str).to_dict(), etag)
+
 
+class LinkedRecords(Resource):
+    kind = None
+    linked = None
 
-class RelationshipLinkedObjects(Resource):
     def get(self, id):
         log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
+        args = pagination_args_parser.parse_args()
+        limit = check_limit(args['limit'])
+        if args['expand'] is not None or not (BLUEPRINT.config.get("CONDITIONAL_GETS") or
+                                              BLUEPRINT.config.get('list_cache') is not None):
+            # Expanded pages change with the listed records, not just the listing
+            return self.page(id, args, limit)
+        generation = BLUEPRINT.config['storage'].get_generation(id)
+        view = (args['cursor'], limit, args['compact'], args['total'])
+        etag, not_modified = conditional_get(
+            id, "linked" + self.linked.plural, *view, generation=generation
+        )
+        if not_modified is not None:
+            return not_modified
+        r = cached_page((id, self.linked.name) + view, generation,
+                        lambda: self.page(id, args, limit))
+        return with_etag(r, etag)
+
+    def page(self, id, args, limit):
+        q = BLUEPRINT.config['storage'].get_kind_links(self.linked.name, id, args['cursor'], limit)
         r = {}
-        q = BLUEPRINT.config['storage'].get_kind_links("object", id, args['cursor'], check_limit(args['limit']))
         r['pagination'] = {}
         r['pagination']['starting_cursor'] = args['cursor']
         r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['linkingObjectIdentifier_list'] = [
-            {'id': x, '_link': API.url_for(Object, id=x)}
-            for x in q[1]
-        ]
+        r['pagination']['limit'] = limit
+        if args['total']:
+            r['pagination']['total'] = \
+                BLUEPRINT.config['storage'].count_kind_links(self.linked.name, id)
+        listing(r, self.linked.linking_field + "_list", self.linked.name,
+                self.linked.record_resource, q[1], args)
         return r
 
     def post(self, id):
         log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("object_id", type=str, required=True)
-        args = parser.parse_args()
-        if not BLUEPRINT.config['storage'].record_exists("relationship", id):
+        args = self.linked.link_args_parser.parse_args()
+        linked_id = args[self.linked.name + "_id"]
+        if not BLUEPRINT.config['storage'].record_exists(self.kind.name, id):
             raise IdentifierDoesNotExistError(str(id))
-        if not BLUEPRINT.config['storage'].record_exists("object", args['object_id']):
-            raise IdentifierDoesNotExistError(str(args['object_id']))
-        BLUEPRINT.config['storage'].link_records("object", args['object_id'], "relationship", id)
+        if not BLUEPRINT.config['storage'].record_exists(self.linked.name, linked_id):
+            raise IdentifierDoesNotExistError(str(linked_id))
+        # link_records() takes the relationship as its second record
+        if self.kind.name == "relationship":
+            BLUEPRINT.config['storage'].link_records(self.linked.name, linked_id, self.kind.name, id)
+        else:
+            BLUEPRINT.config['storage'].link_records(self.kind.name, id, self.linked.name, linked_id)
         return id
 
 
-class RelationshipLinkedEvents(Resource):
-    def get(self, id):
+class KindCount(Resource):
+    kind = None
+
+    def get(self):
         log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
-        r = {}
-        q = BLUEPRINT.config['storage'].get_kind_links("event", id, args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['linkingEventIdentifier_list'] = [
-            {'id': x, '_link': API.url_for(Event, id=x)}
-            for x in q[1]
-        ]
-        return r
+        return {"count": BLUEPRINT.config['storage'].count_kind(self.kind.name)}
 
-    def post(self, id):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("event_id", type=str, required=True)
-        args = parser.parse_args()
-        if not BLUEPRINT.config['storage'].record_exists("relationship", id):
-            raise IdentifierDoesNotExistError(str(id))
-        if not BLUEPRINT.config['storage'].record_exists("event", args['event_id']):
-            raise IdentifierDoesNotExistError(str(args['event_id']))
-        BLUEPRINT.config['storage'].link_records("event", args['event_id'], "relationship", id)
-        return id
 
+class RecordDegree(Resource):
+    kind = None
 
-class RelationshipLinkedAgents(Resource):
     def get(self, id):
         log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
+        if not BLUEPRINT.config['storage'].record_exists(self.kind.name, id):
+            raise IdentifierDoesNotExistError(str(id))
         r = {}
-        q = BLUEPRINT.config['storage'].get_kind_links("agent", id, args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['linkingAgentIdentifier_list'] = [
-            {'id': x, '_link': API.url_for(Agent, id=x)}
-            for x in q[1]
-        ]
+        for x in self.kind.links:
+            r["linked" + kind_table[x].plural] = \
+                BLUEPRINT.config['storage'].count_kind_links(x, id)
         return r
 
-    def post(self, id):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("agent_id", type=str, required=True)
-        args = parser.parse_args()
-        if not BLUEPRINT.config['storage'].record_exists("relationship", id):
-            raise IdentifierDoesNotExistError(str(id))
-        if not BLUEPRINT.config['storage'].record_exists("agent", args['agent_id']):
-            raise IdentifierDoesNotExistError(str(args['agent_id']))
-        BLUEPRINT.config['storage'].link_records("agent", args['agent_id'], "relationship", id)
-        return id
 
+kind_table = {
+    "object": RecordKind("object", "Objects"),
+    "event": RecordKind("event", "Events"),
+    "agent": RecordKind("agent", "Agents"),
+    "rights": RecordKind("rights", "Rights"),
+    "relationship": RecordKind("relationship", "Relationships")
+}
+
+
+def make_resources():
+    """
+    Builds the Resource classes serving each kind of record in kind_table
+
+    The classes keep the names the hand written resources had (ObjectList,
+    Object, SparseObject, ObjectLinkedRelationships, ...), and the newer
+    ones follow the same pattern (ObjectCount, ObjectDegree), both as endpoint
+    names and as module attributes, so API.url_for() lookups are unchanged.
+    """
+    for kind in kind_table.values():
+        kind.list_resource = type(kind.title + "List", (KindList,), {"kind": kind})
+        kind.record_resource = type(kind.title, (Record,), {"kind": kind})
+        kind.sparse_resource = type("Sparse" + kind.title, (SparseRecord,), {"kind": kind})
+        kind.count_resource = type(kind.title + "Count", (KindCount,), {"kind": kind})
+        kind.degree_resource = type(kind.title + "Degree", (RecordDegree,), {"kind": kind})
+        for x in kind.links:
+            linked = kind_table[x]
+            kind.linked_resources[x] = type(
+                kind.title + "Linked" + linked.plural, (LinkedRecords,),
+                {"kind": kind, "linked": linked}
+            )
+        for resource in [kind.list_resource, kind.record_resource, kind.sparse_resource,
+                         kind.count_resource, kind.degree_resource] + \
+                list(kind.linked_resources.values()):
+            globals()[resource.__name__] = resource
 
-class RelationshipLinkedRights(Resource):
-    def get(self, id):
-        log.debug("GET received @ {}".format(self.__class__.__name__))
-        parser = pagination_args_parser.copy()
-        args = parser.parse_args()
-        r = {}
-        q = BLUEPRINT.config['storage'].get_kind_links("rights", id, args['cursor'], check_limit(args['limit']))
-        r['pagination'] = {}
-        r['pagination']['starting_cursor'] = args['cursor']
-        r['pagination']['next_cursor'] = q[0] if q[0] != 0 else None
-        r['pagination']['limit'] = check_limit(args['limit'])
-        r['linkingRightsIdentifier_list'] = [
-            {'id': x, '_link': API.url_for(Rights, id=x)}
-            for x in q[1]
-        ]
-        return r
 
-    def post(self, id):
-        log.debug("POST received @ {}".format(self.__class__.__name__))
-        parser = reqparse.RequestParser()
-        parser.add_argument("rights_id", type=str, required=True)
-        args = parser.parse_args()
-        if not BLUEPRINT.config['storage'].record_exists("relationship", id):
-            raise IdentifierDoesNotExistError(str(id))
-        if not BLUEPRINT.config['storage'].record_exists("rights", args['rights_id']):
-            raise IdentifierDoesNotExistError(str(args['rights_id']))
-        BLUEPRINT.config['storage'].link_records("rights", args['rights_id'], "relationship", id)
-        return id
+make_resources()
+
+
+class Root(Resource):
+    def get(self):
+        log.debug("GET received @ {}".format(self.__class__.__name__))
+        return {x.list_key: API.url_for(x.list_resource) for x in kind_table.values()}
 
 
 class Version(Resource):
     def get(self):
         return {"version": __version__}
 
+
+class Stats(Resource):
+    def get(self):
+        log.debug("GET received @ {}".format(self.__class__.__name__))
+        stats = dict(BLUEPRINT.config['storage'].stats())
+        if BLUEPRINT.config.get('list_cache') is not None:
+            stats['list_cache'] = BLUEPRINT.config['list_cache'].stats()
+        if BLUEPRINT.config.get('ingest_queue') is not None:
+            stats['ingest_queue'] = BLUEPRINT.config['ingest_queue'].stats()
+        if BLUEPRINT.config.get('admission'):
+            stats['admission'] = {x: y.stats() for x, y in BLUEPRINT.config['admission'].items()}
+        return stats
+
+
+class IngestStatus(Resource):
+    def get(self, ticket):
+        log.debug("GET received @ {}".format(self.__class__.__name__))
+        queue = BLUEPRINT.config.get('ingest_queue')
+        status = queue.status(ticket) if queue is not None else None
+        if status is None:
+            raise NotFoundError("No ingest ticket {}".format(ticket))
+        r = {}
+        r['_link'] = API.url_for(IngestStatus, ticket=ticket)
+        r['ticket'] = ticket
+        r['id'] = status['id']
+        r['state'] = status['state']
+        if status['state'] == "stored":
+            r['record'] = API.url_for(kind_table[status['kind']].record_resource, id=status['id'])
+        if status['error'] is not None:
+            r['error'] = status['error']
+        return r
+
+class AdmissionLimiter:
+    """
+    Admits up to limit concurrent requests, queueing up to queue_size
+    more for at most timeout seconds each, and refusing the rest
+
+    __Args__
+
+    1. limit (int): The most requests to serve at once
+    2. queue_size (int/None): The most requests to queue, or None for limit
+    3. timeout (int/float): The most seconds a request waits in the queue
+    """
+    def __init__(self, limit, queue_size=None, timeout=1):
+        self.limit = limit
+        self.queue_size = limit if queue_size is None else queue_size
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_time = 0.0
+
+    def acquire(self):
+        """
+        __Returns__
+
+        * (bool): Whether or not the request was admitted. An admitted
+            request must be release()d when it is done.
+        """
+        with self.condition:
+            # Arrivals don't overtake queued requests
+            if self.in_flight < self.limit and self.waiting == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue_size:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            self.queued += 1
+            start = time.monotonic()
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = start + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+                self.wait_time += time.monotonic() - start
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "wait_time": self.wait_time
+            }
+
+
+def admission_class():
+    """
+    Classifies the current request for admission control
+
+    __Returns__
+
+    * (str/None): "writes", "hydrations", "bulk" or "reads", or None for
+        requests which are always admitted (/, /version, /stats)
+    """
+    if request.method in ("POST", "PATCH"):
+        return "writes"
+    resource = getattr(current_app.view_functions.get(request.endpoint), "view_class", None)
+    if resource is None:
+        return None
+    if issubclass(resource, Record):
+        return "hydrations"
+    if issubclass(resource, (KindList, LinkedRecords)):
+        return "hydrations" if request.args.get("expand") == "full" else "bulk"
+    if issubclass(resource, (SparseRecord, KindCount, RecordDegree, IngestStatus)):
+        return "reads"
+    return None
+
+
+@BLUEPRINT.before_request
+def admit_request():
+    limiters = BLUEPRINT.config.get('admission')
+    if not limiters:
+        return
+    name = admission_class()
+    if name not in limiters:
+        return
+    if not limiters[name].acquire():
+        raise ServiceUnavailableError(
+            "Too many {} in progress, try again later".format(name),
+            BLUEPRINT.config.get('ADMISSION_RETRY_AFTER', 1)
+        )
+    g.admission = limiters[name]
+
+
+@BLUEPRINT.after_request
+def hand_admission_to_response(response):
+    # A streamed body is generated after the request is torn down, so
+    # its slot is held until the response is closed
+    if response.is_streamed and g.get('admission') is not None:
+        response.call_on_close(g.pop('admission').release)
+    return response
+
+
+@BLUEPRINT.teardown_request
+def release_admission(error):
+    # Responses which weren't streamed, and errors, release here
+    limiter = g.pop('admission', None)
+    if limiter is not None:
+        limiter.release()
+
+
 @BLUEPRINT.record
 def handle_configs(setup_state):
     app = setup_state.app
@@ -1175,40 +4038,146 @@ def handle_configs(setup_state):
     else:
         BLUEPRINT.config['storage'] = storage_backends[BLUEPRINT.config['STORAGE_BACKEND']](BLUEPRINT)
 
-    if BLUEPRINT.config.get("VERBOSITY"):
-        logging.basicConfig(level=BLUEPRINT.config['VERBOSITY'])
-    else:
-        logging.basicConfig(level="WARN")
+    # Retry reads, and fail fast while the storage backend is down
+    if BLUEPRINT.config.get('BACKEND_POLICY'):
+        BLUEPRINT.config['storage'] = PolicyStorageBackend(
+            BLUEPRINT.config['storage'],
+            CircuitBreaker(
+                BLUEPRINT.config.get('BREAKER_THRESHOLD', 5),
+                BLUEPRINT.config.get('BREAKER_RESET_TIMEOUT', 10)
+            ),
+            retries=BLUEPRINT.config.get('BACKEND_RETRIES', 2),
+            backoff=BLUEPRINT.config.get('BACKEND_RETRY_BACKOFF', 0.05)
+        )
+
+    # Coalesce concurrent link writes into batches
+    if BLUEPRINT.config.get('LINK_WRITE_COALESCING'):
+        BLUEPRINT.config['storage'] = CoalescingStorageBackend(
+            BLUEPRINT.config['storage'],
+            BLUEPRINT.config.get('LINK_WRITE_WINDOW', 0.002),
+            BLUEPRINT.config.get('LINK_WRITE_BATCH_SIZE', 100)
+        )
+
+    # Cache records and link sets in front of the storage backend
+    record_cache = None
+    if BLUEPRINT.config.get('SHARED_CACHE_PATH'):
+        record_cache = SharedMemoryCache(
+            BLUEPRINT.config['SHARED_CACHE_PATH'],
+            BLUEPRINT.config.get('SHARED_CACHE_SIZE', 268435456),
+            BLUEPRINT.config.get('SHARED_CACHE_SLOT_SIZE', 4096),
+            BLUEPRINT.config.get('CACHE_TTL')
+        )
+    if record_cache is not None or BLUEPRINT.config.get('RECORD_CACHE_SIZE') or \
+            BLUEPRINT.config.get('LINK_CACHE_SIZE'):
+        BLUEPRINT.config['storage'] = CachingStorageBackend(
+            BLUEPRINT.config['storage'],
+            record_size=BLUEPRINT.config.get('RECORD_CACHE_SIZE'),
+            link_size=BLUEPRINT.config.get('LINK_CACHE_SIZE'),
+            ttl=BLUEPRINT.config.get('CACHE_TTL'),
+            record_cache=record_cache
+        )
+
+    # Answer lookups of unknown identifiers from a Bloom filter
+    if BLUEPRINT.config.get('BLOOM_FILTER'):
+        # A filter private to one worker misses the records the others add,
+        # and would answer lookups of them with false 404s
+        if not BLUEPRINT.config.get('BLOOM_FILTER_PATH'):
+            raise ConfigError("BLOOM_FILTER requires a BLOOM_FILTER_PATH shared by every worker")
+        BLUEPRINT.config['storage'] = BloomFilterStorageBackend(
+            BLUEPRINT.config['storage'],
+            BloomFilter(
+                BLUEPRINT.config.get('BLOOM_FILTER_PATH'),
+                BLUEPRINT.config.get('BLOOM_FILTER_CAPACITY', 10000000),
+                BLUEPRINT.config.get('BLOOM_FILTER_ERROR_RATE', 0.01)
+            ),
+            recheck=BLUEPRINT.config.get('BLOOM_FILTER_RECHECK_INTERVAL', 1),
+            rebuild_interval=BLUEPRINT.config.get('BLOOM_FILTER_REBUILD_INTERVAL', 60)
+        )
+        BLUEPRINT.config['storage'].rebuild()
+
+    # Coalesce concurrent identical reads
+    if BLUEPRINT.config.get('SINGLE_FLIGHT'):
+        BLUEPRINT.config['storage'] = SingleFlightStorageBackend(BLUEPRINT.config['storage'])
+
+    # Queue POSTed records, to be stored by background workers
+    if BLUEPRINT.config.get('INGEST_QUEUE_PATH'):
+        BLUEPRINT.config['ingest_queue'] = IngestQueue(
+            BLUEPRINT.config['INGEST_QUEUE_PATH'],
+            workers=BLUEPRINT.config.get('INGEST_WORKERS', 1),
+            batch_size=BLUEPRINT.config.get('INGEST_BATCH_SIZE', 100),
+            interval=BLUEPRINT.config.get('INGEST_POLL_INTERVAL', 0.1),
+            lease=BLUEPRINT.config.get('INGEST_LEASE', 60),
+            retention=BLUEPRINT.config.get('INGEST_STATUS_RETENTION', 86400),
+            max_attempts=BLUEPRINT.config.get('INGEST_MAX_ATTEMPTS', 5)
+        )
+
+    # Limit the concurrent requests of each class
+    BLUEPRINT.config['admission'] = {}
+    for name in ["reads", "writes", "bulk", "hydrations"]:
+        if BLUEPRINT.config.get('ADMISSION_' + name.upper()):
+            BLUEPRINT.config['admission'][name] = AdmissionLimiter(
+                BLUEPRINT.config['ADMISSION_' + name.upper()],
+                BLUEPRINT.config.get('ADMISSION_QUEUE_SIZE'),
+                BLUEPRINT.config.get('ADMISSION_TIMEOUT', 1)
+            )
 
+    # Cache listing pages, invalidated by the backend's generations
+    if BLUEPRINT.config.get('LIST_CACHE_SIZE'):
+        BLUEPRINT.config['list_cache'] = LRUCache(BLUEPRINT.config['LIST_CACHE_SIZE'])
 
-API.add_resource(Root, "/")
+    # Select the JSON engine used for responses and stored records
+    BLUEPRINT.config['json'] = JSONEngine(BLUEPRINT.config.get('JSON_ENGINE', 'stdlib'))
 
-API.add_resource(ObjectList, "/object_list")
-API.add_resource(Object, "/object_list/<string:id>")
-API.add_resource(SparseObject, "/object_list/<string:id>/sparse")
-API.add_resource(ObjectLinkedRelationships, "/object_list/<string:id>/linkedRelationships")
+    # Compile the schema validator, if one is configured
+    if BLUEPRINT.config.get('VALIDATION_SCHEMA'):
+        with open(BLUEPRINT.config['VALIDATION_SCHEMA']) as f:
+            BLUEPRINT.config['validator'] = SchemaValidator(loads(f.read()))
 
-API.add_resource(EventList, "/event_list")
-API.add_resource(Event, "/event_list/<string:id>")
-API.add_resource(SparseEvent, "/event_list/<string:id>/sparse")
-API.add_resource(EventLinkedRelationships, "/event_list/<string:id>/linkedRelationships")
+    if BLUEPRINT.config.get("VERBOSITY"):
+        logging.basicConfig(level=BLUEPRINT.config['VERBOSITY'])
+    else:
+        logging.basicConfig(level="WARN")
 
-API.add_resource(AgentList, "/agent_list")
-API.add_resource(Agent, "/agent_list/<string:id>")
-API.add_resource(SparseAgent, "/agent_list/<string:id>/sparse")
-API.add_resource(AgentLinkedRelationships, "/agent_list/<string:id>/linkedRelationships")
 
-API.add_resource(RightsList, "/rights_list")
-API.add_resource(Rights, "/rights_list/<string:id>")
-API.add_resource(SparseRights, "/rights_list/<string:id>/sparse")
-API.add_resource(RightsLinkedRelationships, "/rights_list/<string:id>/linkedRelationships")
+@BLUEPRINT.record
+def warm_up_caches(setup_state):
+    """
+    Runs once the blueprint is configured, before the app serves anything
+    """
+    if BLUEPRINT.config.get('DEFER_CONFIG'):
+        return
+    if BLUEPRINT.config.get('ACCESS_SUMMARY_PATH'):
+        BLUEPRINT.config['access_summary'] = AccessSummary(
+            BLUEPRINT.config['ACCESS_SUMMARY_PATH'],
+            BLUEPRINT.config.get('ACCESS_SUMMARY_SIZE', 10000),
+            BLUEPRINT.config.get('ACCESS_SUMMARY_INTERVAL', 60)
+        )
+        atexit.register(BLUEPRINT.config['access_summary'].persist)
+    if BLUEPRINT.config.get('WARM_UP'):
+        warm_up(
+            BLUEPRINT.config['storage'],
+            warm_up_records(),
+            seconds=BLUEPRINT.config.get('WARM_UP_SECONDS', 30),
+            max_size=BLUEPRINT.config.get('WARM_UP_MAX_SIZE')
+        )
 
-API.add_resource(RelationshipList, "/relationship_list")
-API.add_resource(Relationship, "/relationship_list/<string:id>")
-API.add_resource(SparseRelationship, "/relationship_list/<string:id>/sparse")
-API.add_resource(RelationshipLinkedObjects, "/relationship_list/<string:id>/linkedObjects")
-API.add_resource(RelationshipLinkedEvents, "/relationship_list/<string:id>/linkedEvents")
-API.add_resource(RelationshipLinkedAgents, "/relationship_list/<string:id>/linkedAgents")
-API.add_resource(RelationshipLinkedRights, "/relationship_list/<string:id>/linkedRights")
 
-API.add_resource(Version, '/version')
+def register_resources(api):
+    """
+    Registers every resource, generated ones included, on the API
+    """
+    api.add_resource(Root, "/")
+    for kind in kind_table.values():
+        api.add_resource(kind.list_resource, kind.path)
+        api.add_resource(kind.count_resource, "/" + kind.name + "_count")
+        api.add_resource(kind.record_resource, kind.path + "/<string:id>")
+        api.add_resource(kind.sparse_resource, kind.path + "/<string:id>/sparse")
+        api.add_resource(kind.degree_resource, kind.path + "/<string:id>/degree")
+        for x, resource in kind.linked_resources.items():
+            api.add_resource(resource, kind.path + "/<string:id>/linked" + kind_table[x].plural)
+    api.add_resource(Version, '/version')
+    api.add_resource(Stats, '/stats')
+    api.add_resource(IngestStatus, '/ingest_status/<int:ticket>')
+
+
+register_resources(API)
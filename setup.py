@@ -21,8 +21,16 @@ setup(
         'flask>0',
         'flask_env',
         'flask_restful',
-        'redis',
+        'redis>=3',
         'pymongo',
         'pyqremis'
     ],
+    extras_require = {
+        'schema': ['jsonschema'],
+        'orjson': ['orjson'],
+        'ujson': ['ujson'],
+        'compression': ['brotli', 'zstandard'],
+        'binary': ['cbor2', 'msgpack'],
+        'asgi': ['asgiref', 'motor', 'redis>=4.2']
+    },
 )
@@ -1,11 +1,24 @@
 from uuid import uuid4
+import asyncio
 import datetime
+import gzip
 import unittest
 import json
 from os import environ
+import os
+import tempfile
+import threading
+import time
+
+import redis
 
 from pyqremis import *
 
+try:
+    import asgiref
+except ImportError:
+    asgiref = None
+
 # Differ all configuration of the app
 # to the tests setUp() function
 
@@ -56,6 +69,64 @@ def add_linkingRelationshipIdentifier(entity, rel_id):
     )
 
 
+async def asgi_get(app, path):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({"type": "http", "method": "GET", "path": path, "root_path": "",
+               "query_string": b"", "headers": [], "http_version": "1.1", "scheme": "http",
+               "server": ("localhost", 80), "client": ("localhost", 1234),
+               "asgi": {"version": "3.0"}}, receive, send)
+    return messages[0]['status'], b"".join(x.get('body', b"") for x in messages[1:])
+
+
+def make_schemas():
+    schemas = {}
+    for kind in ["object", "event", "agent", "rights", "relationship"]:
+        id_field = kind + "Identifier"
+        schemas[kind] = {
+            "type": "object",
+            "required": [id_field],
+            "properties": {
+                id_field: {
+                    "type": "array",
+                    "minItems": 1,
+                    "items": {
+                        "type": "object",
+                        "required": [id_field + "Type", id_field + "Value"],
+                        "properties": {
+                            id_field + "Type": {"type": "string"},
+                            id_field + "Value": {"type": "string"}
+                        }
+                    }
+                }
+            }
+        }
+    return schemas
+
+
+def make_local_object():
+    objIdentifier = ObjectIdentifier(objectIdentifierType="local", objectIdentifierValue=uuid4().hex)
+    objChar = ObjectCharacteristics(Format(FormatDesignation(formatName="foo")))
+    return Object(objIdentifier, objChar, objectCategory="file")
+
+
+def make_badly_linked_event():
+    event = make_event()
+    event.add_linkingRelationshipIdentifier(
+        LinkingRelationshipIdentifier(
+            linkingRelationshipIdentifierType="local",
+            linkingRelationshipIdentifierValue=uuid4().hex
+        )
+    )
+    return event
+
+
 class TestsMixin:
     def setUp(self):
         self.maxDiff = None
@@ -1286,6 +1357,1053 @@ class TestsMixin:
         for x in comp_rel_ids:
             self.assertIn(x, relationship_ids)
 
+    def test_getSparsePassthrough(self):
+        entity = make_relationship()
+        entity_json = entity.to_dict()
+        prj = self.response_200_json(
+            self.app.post("/relationship_list", data={"record": json.dumps(entity_json)})
+        )
+        qremis_api.blueprint.BLUEPRINT.config['SPARSE_PASSTHROUGH'] = True
+        try:
+            grv = self.app.get("/relationship_list/{}/sparse".format(prj['id']))
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['SPARSE_PASSTHROUGH'] = False
+        self.assertEqual(grv.mimetype, "application/json")
+        grj = self.response_200_json(grv)
+        self.assertEqual(entity_json, grj)
+
+    def test_getSparsePassthroughNonExistant(self):
+        qremis_api.blueprint.BLUEPRINT.config['SPARSE_PASSTHROUGH'] = True
+        try:
+            grv = self.app.get("/object_list/{}/sparse".format(uuid4().hex))
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['SPARSE_PASSTHROUGH'] = False
+        self.assertEqual(grv.status_code, 404)
+
+    def test_getSplicedLinksMatchesModel(self):
+        relationship = make_relationship()
+        relationship_id = relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+        self.response_200_json(
+            self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+        )
+        entities = [
+            ("object_list", make_object(), "objectIdentifier"),
+            ("event_list", make_event(), "eventIdentifier"),
+            ("agent_list", make_agent(), "agentIdentifier"),
+            ("rights_list", make_rights(), "rightsIdentifier")
+        ]
+        urls = ["/relationship_list/{}".format(relationship_id)]
+        for list_name, entity, id_field in entities:
+            entity_id = getattr(getattr(entity, "get_" + id_field)()[0], "get_" + id_field + "Value")()
+            add_linkingRelationshipIdentifier(entity, relationship_id)
+            self.response_200_json(
+                self.app.post("/" + list_name, data={"record": json.dumps(entity.to_dict())})
+            )
+            urls.append("/{}/{}".format(list_name, entity_id))
+        for url in urls:
+            mrv = self.app.get(url)
+            self.assertEqual(mrv.status_code, 200)
+            qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = True
+            try:
+                srv = self.app.get(url)
+            finally:
+                qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = False
+            self.assertEqual(srv.status_code, 200)
+            self.assertEqual(json.loads(srv.data.decode()), json.loads(mrv.data.decode()))
+            self.assertEqual(srv.data.decode() + "\n", mrv.data.decode())
+
+    def test_schemaValidatorMatchesPyqremis(self):
+        if qremis_api.blueprint.jsonschema is None:
+            self.skipTest("jsonschema is not installed")
+        validator = qremis_api.blueprint.SchemaValidator(make_schemas())
+        cases = [
+            ("object_list", lambda: json.dumps(make_object().to_dict())),
+            ("event_list", lambda: json.dumps(make_event().to_dict())),
+            ("agent_list", lambda: json.dumps(make_agent().to_dict())),
+            ("rights_list", lambda: json.dumps(make_rights().to_dict())),
+            ("relationship_list", lambda: json.dumps(make_relationship().to_dict())),
+            ("object_list", lambda: "This isn't qremis"),
+            ("relationship_list", lambda: "[]"),
+            ("object_list", lambda: json.dumps(make_local_object().to_dict())),
+            ("event_list", lambda: json.dumps(make_badly_linked_event().to_dict()))
+        ]
+        for list_name, make_record in cases:
+            mrv = self.app.post("/" + list_name, data={"record": make_record()})
+            record = make_record()
+            qremis_api.blueprint.BLUEPRINT.config['validator'] = validator
+            try:
+                vrv = self.app.post("/" + list_name, data={"record": record})
+            finally:
+                qremis_api.blueprint.BLUEPRINT.config['validator'] = None
+            self.assertEqual(vrv.status_code, mrv.status_code)
+            if mrv.status_code != 200:
+                self.assertEqual(json.loads(vrv.data.decode())['error_name'],
+                                 json.loads(mrv.data.decode())['error_name'])
+                continue
+            vrj = self.response_200_json(vrv)
+            grj = self.response_200_json(self.app.get("/{}/{}".format(list_name, vrj['id'])))
+            self.assertEqual(grj, json.loads(record))
+        # Linking fields the schema doesn't constrain are checked before
+        # anything is stored
+        for value in [["x"], 5, [{"linkingRelationshipIdentifierType": "uuid",
+                                  "linkingRelationshipIdentifierValue": 7}]]:
+            record = make_event().to_dict()
+            record["linkingRelationshipIdentifier"] = value
+            qremis_api.blueprint.BLUEPRINT.config['validator'] = validator
+            try:
+                vrv = self.app.post("/event_list", data={"record": json.dumps(record)})
+            finally:
+                qremis_api.blueprint.BLUEPRINT.config['validator'] = None
+            self.assertEqual(vrv.status_code, 400)
+            self.assertEqual(json.loads(vrv.data.decode())['error_name'], "InvalidQremisRecordError")
+            event_id = record["eventIdentifier"][0]["eventIdentifierValue"]
+            self.assertEqual(self.app.get("/event_list/{}".format(event_id)).status_code, 404)
+
+    def test_jsonEngines(self):
+        for name, module in [("stdlib", json),
+                             ("orjson", qremis_api.blueprint.orjson),
+                             ("ujson", qremis_api.blueprint.ujson)]:
+            if module is None:
+                continue
+            entity = make_event()
+            entity_json = entity.to_dict()
+            qremis_api.blueprint.BLUEPRINT.config['json'] = qremis_api.blueprint.JSONEngine(name)
+            try:
+                prj = self.response_200_json(
+                    self.app.post("/event_list", data={"record": json.dumps(entity_json)})
+                )
+                grj = self.response_200_json(self.app.get("/event_list/{}".format(prj['id'])))
+                lrj = self.response_200_json(self.app.get("/event_list"))
+            finally:
+                qremis_api.blueprint.BLUEPRINT.config['json'] = qremis_api.blueprint.JSONEngine()
+            self.assertEqual(entity_json, grj)
+            self.assertIn(prj['id'], [x['id'] for x in lrj['event_list']])
+
+    def test_compressedObjectList(self):
+        for _ in range(50):
+            self.app.post("/object_list", data={"record": json.dumps(make_object().to_dict())})
+        qremis_api.blueprint.BLUEPRINT.config['COMPRESSION'] = True
+        try:
+            crv = self.app.get("/object_list", headers={"Accept-Encoding": "gzip"})
+            rv = self.app.get("/object_list", headers={"Accept-Encoding": "gzip;q=0"})
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['COMPRESSION'] = False
+        self.assertEqual(crv.status_code, 200)
+        self.assertEqual(crv.headers['Content-Encoding'], "gzip")
+        self.assertIn("Accept-Encoding", crv.headers['Vary'])
+        self.assertNotIn("Content-Encoding", rv.headers)
+        self.assertEqual(json.loads(gzip.decompress(crv.data).decode()), self.response_200_json(rv))
+
+    def test_binaryRepresentations(self):
+        representations = []
+        if qremis_api.blueprint.cbor2 is not None:
+            representations.append(("application/cbor", qremis_api.blueprint.cbor2.loads))
+        if qremis_api.blueprint.msgpack is not None:
+            representations.append(("application/msgpack", qremis_api.blueprint.msgpack.unpackb))
+        if not representations:
+            self.skipTest("Neither cbor2 nor msgpack is installed")
+        entity = make_agent()
+        entity_json = entity.to_dict()
+        prj = self.response_200_json(
+            self.app.post("/agent_list", data={"record": json.dumps(entity_json)})
+        )
+        for mediatype, decode in representations:
+            grv = self.app.get("/agent_list/{}".format(prj['id']), headers={"Accept": mediatype})
+            self.assertEqual(grv.status_code, 200)
+            self.assertEqual(grv.mimetype, mediatype)
+            self.assertEqual(decode(grv.data), entity_json)
+            lrv = self.app.get("/agent_list", headers={"Accept": mediatype})
+            self.assertEqual(lrv.status_code, 200)
+            self.assertIn(prj['id'], [x['id'] for x in decode(lrv.data)['agent_list']])
+            erv = self.app.get("/agent_list/{}".format(uuid4().hex), headers={"Accept": mediatype})
+            self.assertEqual(erv.status_code, 404)
+            self.assertEqual(decode(erv.data)['error_name'], "IdentifierDoesNotExistError")
+
+    def test_conditionalGet(self):
+        relationship = make_relationship()
+        relationship_id = relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+        self.response_200_json(
+            self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+        )
+        urls = [
+            "/relationship_list/{}".format(relationship_id),
+            "/relationship_list/{}/sparse".format(relationship_id),
+            "/relationship_list/{}/linkedAgents".format(relationship_id)
+        ]
+        qremis_api.blueprint.BLUEPRINT.config['CONDITIONAL_GETS'] = True
+        try:
+            etags = {}
+            for url in urls:
+                rv = self.app.get(url)
+                self.response_200_json(rv)
+                etags[url] = rv.headers['ETag']
+                crv = self.app.get(url, headers={"If-None-Match": etags[url]})
+                self.assertEqual(crv.status_code, 304)
+                self.assertEqual(crv.headers['ETag'], etags[url])
+            agent = make_agent()
+            add_linkingRelationshipIdentifier(agent, relationship_id)
+            self.response_200_json(
+                self.app.post("/agent_list", data={"record": json.dumps(agent.to_dict())})
+            )
+            for url in urls:
+                rv = self.app.get(url, headers={"If-None-Match": etags[url]})
+                self.response_200_json(rv)
+                self.assertNotEqual(rv.headers['ETag'], etags[url])
+            # An identifier which was never stored isn't "not modified"
+            unknown_id = uuid4().hex
+            for url, etag in [("/relationship_list/{}".format(unknown_id), '"full-0-json"'),
+                              ("/relationship_list/{}/sparse".format(unknown_id), '"sparse-0-json"')]:
+                self.assertEqual(self.app.get(url, headers={"If-None-Match": etag}).status_code, 404)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['CONDITIONAL_GETS'] = False
+
+    def test_expandedListings(self):
+        relationship = make_relationship()
+        relationship_id = relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+        self.response_200_json(
+            self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+        )
+        for _ in range(5):
+            obj = make_object()
+            add_linkingRelationshipIdentifier(obj, relationship_id)
+            self.response_200_json(
+                self.app.post("/object_list", data={"record": json.dumps(obj.to_dict())})
+            )
+        for expand in ["sparse", "full"]:
+            rj = self.response_200_json(
+                self.app.get("/relationship_list/{}/linkedObjects".format(relationship_id),
+                             data={"expand": expand})
+            )
+            self.assertEqual(len(rj['linkingObjectIdentifier_list']), 5)
+            for x in rj['linkingObjectIdentifier_list']:
+                url = x['_link'] if expand == "full" else x['_link'] + "/sparse"
+                self.assertEqual(x['record'], self.response_200_json(self.app.get(url)))
+        rv = self.app.get("/object_list", data={"expand": "everything"})
+        self.assertEqual(rv.status_code, 400)
+
+    def test_compactListing(self):
+        entity = make_rights()
+        prj = self.response_200_json(
+            self.app.post("/rights_list", data={"record": json.dumps(entity.to_dict())})
+        )
+        rj = self.response_200_json(self.app.get("/rights_list", data={"compact": "true"}))
+        self.assertIn(prj['id'], rj['rights_list'])
+        self.assertEqual(rj['_link_template'].replace("{id}", prj['id']), prj['_link'])
+        full_rj = self.response_200_json(self.app.get("/rights_list"))
+        self.assertEqual(rj['rights_list'], [x['id'] for x in full_rj['rights_list']])
+
+    def test_counts(self):
+        self.assertEqual(self.response_200_json(self.app.get("/event_count"))['count'], 0)
+        # "count" is an identifier like any other under the listing
+        self.assertEqual(self.app.get("/event_list/count").status_code, 404)
+        event = make_event()
+        event_id = event.get_eventIdentifier()[0].get_eventIdentifierValue()
+        self.response_200_json(
+            self.app.post("/event_list", data={"record": json.dumps(event.to_dict())})
+        )
+        for _ in range(3):
+            relationship = make_relationship()
+            self.response_200_json(
+                self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+            )
+            self.response_200_json(
+                self.app.post(
+                    "/event_list/{}/linkedRelationships".format(event_id),
+                    data={"relationship_id": relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()}
+                )
+            )
+        self.assertEqual(self.response_200_json(self.app.get("/event_count"))['count'], 1)
+        self.assertEqual(self.response_200_json(self.app.get("/relationship_count"))['count'], 3)
+        rj = self.response_200_json(self.app.get("/event_list/{}/degree".format(event_id)))
+        self.assertEqual(rj, {"linkedRelationships": 3})
+        rj = self.response_200_json(
+            self.app.get("/event_list/{}/linkedRelationships".format(event_id), data={"limit": 2, "total": "true"})
+        )
+        self.assertEqual(rj['pagination']['total'], 3)
+        rj = self.response_200_json(self.app.get("/relationship_list", data={"total": "true"}))
+        self.assertEqual(rj['pagination']['total'], 3)
+        self.assertNotIn('total', self.response_200_json(self.app.get("/relationship_list"))['pagination'])
+        self.assertEqual(self.app.get("/event_list/{}/degree".format(uuid4().hex)).status_code, 404)
+
+    def test_hydrationLimit(self):
+        event = make_event()
+        event_id = event.get_eventIdentifier()[0].get_eventIdentifierValue()
+        self.response_200_json(
+            self.app.post("/event_list", data={"record": json.dumps(event.to_dict())})
+        )
+        for _ in range(5):
+            relationship = make_relationship()
+            self.response_200_json(
+                self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+            )
+            self.response_200_json(
+                self.app.post(
+                    "/event_list/{}/linkedRelationships".format(event_id),
+                    data={"relationship_id": relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()}
+                )
+            )
+        qremis_api.blueprint.BLUEPRINT.config['HYDRATION_LIMIT'] = 3
+        try:
+            for splice in (False, True):
+                qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = splice
+                rj = self.response_200_json(self.app.get("/event_list/{}".format(event_id)))
+                self.assertEqual(len(rj['linkingRelationshipIdentifier']), 3)
+                marker = rj['_truncated']['linkingRelationshipIdentifier']
+                self.assertEqual(marker['embedded'], 3)
+                self.assertEqual(marker['total'], 5)
+                self.assertEqual(marker['_link'], "/event_list/{}/linkedRelationships".format(event_id))
+            qremis_api.blueprint.BLUEPRINT.config['HYDRATION_LIMIT'] = 5
+            rj = self.response_200_json(self.app.get("/event_list/{}".format(event_id)))
+            self.assertEqual(len(rj['linkingRelationshipIdentifier']), 5)
+            self.assertNotIn('_truncated', rj)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['HYDRATION_LIMIT'] = None
+            qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = False
+
+    def test_streamedFullRecord(self):
+        relationship = make_relationship()
+        rel_id = relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+        self.response_200_json(
+            self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+        )
+        for _ in range(3):
+            for kind, entity in (("object", make_object()), ("event", make_event())):
+                self.response_200_json(
+                    self.app.post("/{}_list".format(kind), data={"record": json.dumps(entity.to_dict())})
+                )
+                self.response_200_json(
+                    self.app.post(
+                        "/relationship_list/{}/linked{}s".format(rel_id, kind.capitalize()),
+                        data={"{}_id".format(kind): entity.to_dict()["{}Identifier".format(kind)][0]["{}IdentifierValue".format(kind)]}
+                    )
+                )
+        whole = self.app.get("/relationship_list/{}".format(rel_id)).data
+        qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = True
+        try:
+            spliced = self.app.get("/relationship_list/{}".format(rel_id)).data
+            qremis_api.blueprint.BLUEPRINT.config['STREAM_THRESHOLD'] = 6
+            streamed = self.app.get("/relationship_list/{}".format(rel_id)).data
+            self.assertEqual(streamed, spliced)
+            self.assertEqual(json.loads(streamed.decode()), json.loads(whole.decode()))
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['STREAM_THRESHOLD'] = None
+            qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = False
+
+    def test_streamThresholdProbesLinks(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        relationship = make_relationship()
+        rel_id = relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+        self.response_200_json(
+            self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+        )
+        for _ in range(3):
+            entity = make_object()
+            add_linkingRelationshipIdentifier(entity, rel_id)
+            self.response_200_json(
+                self.app.post("/object_list", data={"record": json.dumps(entity.to_dict())})
+            )
+        counts = []
+
+        class CountingStorage(qremis_api.blueprint.StorageBackendWrapper):
+            def count_kind_links(self, kind, id):
+                counts.append(kind)
+                return self.backend.count_kind_links(kind, id)
+
+        qremis_api.blueprint.BLUEPRINT.config['HYDRATION_LIMIT'] = 2
+        qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = True
+        try:
+            whole = self.response_200_json(self.app.get("/relationship_list/{}".format(rel_id)))
+            self.assertEqual(whole['_truncated']['linkingObjectIdentifier']['total'], 3)
+            qremis_api.blueprint.BLUEPRINT.config['storage'] = CountingStorage(storage)
+            # Under the threshold, the probe got every link, so nothing is counted
+            qremis_api.blueprint.BLUEPRINT.config['STREAM_THRESHOLD'] = 100
+            rv = self.app.get("/relationship_list/{}".format(rel_id))
+            self.assertIn("Content-Length", rv.headers)
+            self.assertEqual(self.response_200_json(rv), whole)
+            self.assertEqual(counts, [])
+            # Over it, only the kind which filled the probe is counted
+            qremis_api.blueprint.BLUEPRINT.config['STREAM_THRESHOLD'] = 3
+            rv = self.app.get("/relationship_list/{}".format(rel_id))
+            self.assertNotIn("Content-Length", rv.headers)
+            self.assertEqual(self.response_200_json(rv), whole)
+            self.assertEqual(counts, ["object"])
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['storage'] = storage
+            qremis_api.blueprint.BLUEPRINT.config['STREAM_THRESHOLD'] = None
+            qremis_api.blueprint.BLUEPRINT.config['HYDRATION_LIMIT'] = None
+            qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = False
+
+    def test_patchRecord(self):
+        event = make_event()
+        event_id = event.get_eventIdentifier()[0].get_eventIdentifierValue()
+        self.response_200_json(
+            self.app.post("/event_list", data={"record": json.dumps(event.to_dict())})
+        )
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        generation = storage.get_generation(event_id)
+        rj = self.response_200_json(
+            self.app.patch("/event_list/{}".format(event_id), data={"patch": json.dumps({"eventType": "remediated"})})
+        )
+        self.assertEqual(rj['patch'], {"eventType": "remediated"})
+        self.assertEqual(storage.get_generation(event_id), generation + 1)
+        rj = self.response_200_json(self.app.get("/event_list/{}".format(event_id)))
+        self.assertEqual(rj['eventType'], "remediated")
+        self.assertEqual(rj['eventDateTime'], event.get_eventDateTime())
+        # Patches which change nothing write nothing
+        rj = self.response_200_json(
+            self.app.patch("/event_list/{}".format(event_id), data={"patch": json.dumps({"eventType": "remediated"})})
+        )
+        self.assertEqual(rj['patch'], {})
+        self.assertEqual(storage.get_generation(event_id), generation + 1)
+        rv = self.app.patch("/event_list/{}".format(event_id), data={"patch": json.dumps({"eventIdentifier": []})})
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.patch("/event_list/{}".format(uuid4().hex), data={"patch": "{}"})
+        self.assertEqual(rv.status_code, 404)
+        self.assertFalse(storage.replace_record("event", event_id, json.dumps(event.to_dict()), "{}"))
+
+    @unittest.skipIf(asgiref is None, "asgiref is not installed")
+    def test_asgiMatchesWsgi(self):
+        import qremis_api.asgi
+        relationship = make_relationship()
+        rel_id = relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+        self.response_200_json(
+            self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+        )
+        for _ in range(3):
+            entity = make_object()
+            add_linkingRelationshipIdentifier(entity, rel_id)
+            self.response_200_json(
+                self.app.post("/object_list", data={"record": json.dumps(entity.to_dict())})
+            )
+        asgi_app = qremis_api.asgi.QremisASGI(qremis_api.app)
+        try:
+            asgi_app.get_storage()
+        except qremis_api.blueprint.ConfigError as e:
+            self.skipTest(str(e))
+        try:
+            # The flags at their defaults, then natively served
+            for passthrough in (False, True):
+                qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = passthrough
+                qremis_api.blueprint.BLUEPRINT.config['SPARSE_PASSTHROUGH'] = passthrough
+                for path in ("/relationship_list/{}".format(rel_id), "/relationship_list/{}/sparse".format(rel_id),
+                             "/relationship_list/{}".format(uuid4().hex), "/relationship_list"):
+                    # A fresh app per loop, as the async clients belong to their event loop
+                    asgi_app = qremis_api.asgi.QremisASGI(qremis_api.app)
+                    status, body = asyncio.run(asgi_get(asgi_app, path))
+                    rv = self.app.get(path)
+                    self.assertEqual(status, rv.status_code)
+                    self.assertEqual(json.loads(body.decode()), json.loads(rv.data.decode()))
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = False
+            qremis_api.blueprint.BLUEPRINT.config['SPARSE_PASSTHROUGH'] = False
+
+    def test_cachingStorageBackend(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        qremis_api.blueprint.BLUEPRINT.config['storage'] = \
+            qremis_api.blueprint.CachingStorageBackend(storage, record_size=1000000, link_size=1000000)
+        try:
+            relationship = make_relationship()
+            rel_id = relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+            self.response_200_json(
+                self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+            )
+            first = self.response_200_json(self.app.get("/relationship_list/{}".format(rel_id)))
+            self.assertEqual(first, self.response_200_json(self.app.get("/relationship_list/{}".format(rel_id))))
+            stats = self.response_200_json(self.app.get("/stats"))
+            self.assertEqual(stats['record_cache']['hits'], 1)
+            self.assertEqual(stats['record_cache']['misses'], 1)
+            # Linking invalidates the cached link set
+            event = make_event()
+            event_id = event.get_eventIdentifier()[0].get_eventIdentifierValue()
+            self.response_200_json(
+                self.app.post("/event_list", data={"record": json.dumps(event.to_dict())})
+            )
+            self.response_200_json(
+                self.app.post("/relationship_list/{}/linkedEvents".format(rel_id), data={"event_id": event_id})
+            )
+            rj = self.response_200_json(self.app.get("/relationship_list/{}".format(rel_id)))
+            self.assertEqual(rj['linkingEventIdentifier'][0]['linkingEventIdentifierValue'], event_id)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['storage'] = storage
+
+    def test_cacheFollowsOtherWorkers(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        # Another worker's cache, over the same backend
+        other = qremis_api.blueprint.CachingStorageBackend(storage, record_size=1000000, link_size=1000000)
+        qremis_api.blueprint.BLUEPRINT.config['storage'] = \
+            qremis_api.blueprint.CachingStorageBackend(storage, record_size=1000000, link_size=1000000)
+        qremis_api.blueprint.BLUEPRINT.config['CONDITIONAL_GETS'] = True
+        try:
+            relationship = make_relationship()
+            rel_id = relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+            self.response_200_json(
+                self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+            )
+            event = make_event()
+            event_id = event.get_eventIdentifier()[0].get_eventIdentifierValue()
+            self.response_200_json(
+                self.app.post("/event_list", data={"record": json.dumps(event.to_dict())})
+            )
+            rv = self.app.get("/relationship_list/{}".format(rel_id))
+            self.response_200_json(rv)
+            etag = rv.headers['ETag']
+            other.link_records("event", event_id, "relationship", rel_id)
+            rv = self.app.get("/relationship_list/{}".format(rel_id), headers={"If-None-Match": etag})
+            rj = self.response_200_json(rv)
+            self.assertNotEqual(rv.headers['ETag'], etag)
+            self.assertEqual(rj['linkingEventIdentifier'][0]['linkingEventIdentifierValue'], event_id)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['storage'] = storage
+            qremis_api.blueprint.BLUEPRINT.config['CONDITIONAL_GETS'] = False
+
+    def test_cacheHitsSkipBackend(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        reads = []
+
+        class CountingStorage(qremis_api.blueprint.StorageBackendWrapper):
+            def get_generation(self, id):
+                reads.append(id)
+                return self.backend.get_generation(id)
+
+            def get_record(self, id):
+                reads.append(id)
+                return self.backend.get_record(id)
+
+        qremis_api.blueprint.BLUEPRINT.config['storage'] = qremis_api.blueprint.CachingStorageBackend(
+            CountingStorage(storage), record_size=1000000, link_size=1000000, ttl=0.2
+        )
+        qremis_api.blueprint.BLUEPRINT.config['CONDITIONAL_GETS'] = True
+        try:
+            event = make_event()
+            event_id = event.get_eventIdentifier()[0].get_eventIdentifierValue()
+            self.response_200_json(
+                self.app.post("/event_list", data={"record": json.dumps(event.to_dict())})
+            )
+            url = "/event_list/{}/sparse".format(event_id)
+            rv = self.app.get(url)
+            first = self.response_200_json(rv)
+            etag = rv.headers['ETag']
+            del reads[:]
+            self.assertEqual(self.app.get(url, headers={"If-None-Match": etag}).status_code, 304)
+            self.assertEqual(self.response_200_json(self.app.get(url)), first)
+            self.assertEqual(reads, [])
+            # Another worker's change is seen once the cached generation expires
+            record = event.to_dict()
+            record["eventType"] = "changed"
+            self.assertTrue(storage.replace_record("event", event_id, storage.get_record(event_id),
+                                                   json.dumps(record)))
+            self.assertEqual(self.app.get(url, headers={"If-None-Match": etag}).status_code, 304)
+            time.sleep(0.25)
+            rv = self.app.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(self.response_200_json(rv)["eventType"], "changed")
+            self.assertNotEqual(rv.headers['ETag'], etag)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['storage'] = storage
+            qremis_api.blueprint.BLUEPRINT.config['CONDITIONAL_GETS'] = False
+
+    def test_lruCacheEviction(self):
+        cache = qremis_api.blueprint.LRUCache(10)
+        cache.put("a", "a", 4)
+        cache.put("b", "b", 4)
+        cache.get("a")
+        cache.put("c", "c", 4)
+        self.assertEqual(cache.get("a"), "a")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['size'], 8)
+
+    def test_sharedMemoryCache(self):
+        path = os.path.join(tempfile.mkdtemp(), "cache")
+        cache = qremis_api.blueprint.SharedMemoryCache(path, 16384, 1024)
+        cache.put("a", "first")
+        # Another mapping of the same file sees, and can invalidate, the entry
+        other = qremis_api.blueprint.SharedMemoryCache(path, 16384, 1024)
+        self.assertEqual(other.get("a"), "first")
+        other.discard("a")
+        self.assertIsNone(cache.get("a"))
+        for i in range(100):
+            cache.put(str(i), str(i) * 10)
+        for i in range(100):
+            self.assertIn(cache.get(str(i)), (None, str(i) * 10))
+        self.assertGreater(cache.stats()['evictions'], 0)
+        cache.put("big", "x" * 2048)
+        self.assertIsNone(cache.get("big"))
+        os.unlink(path)
+
+    def test_sharedCacheExpiry(self):
+        path = os.path.join(tempfile.mkdtemp(), "cache")
+        cache = qremis_api.blueprint.SharedMemoryCache(path, 16384, 1024, ttl=0.1)
+        cache.put("a", "first")
+        self.assertEqual(cache.get("a"), "first")
+        time.sleep(0.15)
+        self.assertIsNone(cache.get("a"))
+        os.unlink(path)
+
+    def test_sharedCacheFollowsReplacements(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        path = os.path.join(tempfile.mkdtemp(), "cache")
+        first, second = [
+            qremis_api.blueprint.CachingStorageBackend(
+                storage, record_cache=qremis_api.blueprint.SharedMemoryCache(path, 65536, 4096)
+            ) for _ in range(2)
+        ]
+        agent = make_agent()
+        agent_id = agent.get_agentIdentifier()[0].get_agentIdentifierValue()
+        self.response_200_json(
+            self.app.post("/agent_list", data={"record": json.dumps(agent.to_dict())})
+        )
+        old = first.get_record(agent_id)
+        generation = storage.get_generation(agent_id)
+        new = json.dumps(dict(json.loads(old), agentNote="new"))
+        self.assertTrue(first.replace_record("agent", agent_id, old, new))
+        # The second worker read the record before the replacement, and
+        # caches it after
+        second.records.put(second.record_key(agent_id, generation), old)
+        self.assertEqual(second.get_record(agent_id), new)
+        self.assertEqual(first.get_record(agent_id), new)
+        os.unlink(path)
+
+    def test_listPageCache(self):
+        qremis_api.blueprint.BLUEPRINT.config['list_cache'] = qremis_api.blueprint.LRUCache(1000000)
+        try:
+            self.response_200_json(
+                self.app.post("/agent_list", data={"record": json.dumps(make_agent().to_dict())})
+            )
+            generation = qremis_api.blueprint.BLUEPRINT.config['storage'].get_kind_generation("agent")
+            first = self.response_200_json(self.app.get("/agent_list"))
+            self.assertEqual(first, self.response_200_json(self.app.get("/agent_list")))
+            self.assertEqual(self.response_200_json(self.app.get("/stats"))['list_cache']['hits'], 1)
+            # Adding a record bumps the kind's generation, which invalidates the page
+            self.response_200_json(
+                self.app.post("/agent_list", data={"record": json.dumps(make_agent().to_dict())})
+            )
+            self.assertEqual(
+                qremis_api.blueprint.BLUEPRINT.config['storage'].get_kind_generation("agent"), generation + 1
+            )
+            self.assertEqual(len(self.response_200_json(self.app.get("/agent_list"))['agent_list']), 2)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['list_cache'] = None
+
+    def test_bloomFilter(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        entity = make_rights()
+        entity_id = entity.get_rightsIdentifier()[0].get_rightsIdentifierValue()
+        self.response_200_json(
+            self.app.post("/rights_list", data={"record": json.dumps(entity.to_dict())})
+        )
+        wrapped = qremis_api.blueprint.BloomFilterStorageBackend(
+            storage, qremis_api.blueprint.BloomFilter(None, 1000)
+        )
+        wrapped.rebuild()
+        qremis_api.blueprint.BLUEPRINT.config['storage'] = wrapped
+        try:
+            self.response_200_json(self.app.get("/rights_list/{}".format(entity_id)))
+            self.assertEqual(self.app.get("/rights_list/{}".format(uuid4().hex)).status_code, 404)
+            self.assertEqual(wrapped.negatives, 1)
+            added = make_rights()
+            self.response_200_json(
+                self.app.post("/rights_list", data={"record": json.dumps(added.to_dict())})
+            )
+            self.assertEqual(
+                self.app.post("/rights_list", data={"record": json.dumps(added.to_dict())}).status_code, 400
+            )
+            self.response_200_json(
+                self.app.get("/rights_list/{}".format(added.get_rightsIdentifier()[0].get_rightsIdentifierValue()))
+            )
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['storage'] = storage
+
+    def test_bloomFilterSeesOtherHosts(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        hosts = [qremis_api.blueprint.BloomFilterStorageBackend(
+            storage, qremis_api.blueprint.BloomFilter(None, 1000), recheck=0
+        ) for _ in range(2)]
+        for host in hosts:
+            host.rebuild()
+        entity = make_rights()
+        entity_id = entity.get_rightsIdentifier()[0].get_rightsIdentifierValue()
+        rec = json.dumps(entity.to_dict())
+        hosts[0].add_record("rights", entity_id, rec)
+        self.assertFalse(hosts[0].record_exists("rights", uuid4().hex))
+        self.assertEqual(hosts[0].negatives, 1)
+        # The other host's filter never saw the record, so it asks the backend
+        self.assertTrue(hosts[1].record_exists("rights", entity_id))
+        self.assertEqual(hosts[1].get_record(entity_id), rec)
+        self.assertEqual(hosts[1].negatives, 0)
+        # Until it has been rebuilt in the background
+        with hosts[1].rebuilding:
+            pass
+        self.assertTrue(hosts[1].filter.might_contain("rights", entity_id))
+        self.assertFalse(hosts[1].record_exists("rights", uuid4().hex))
+        self.assertEqual(hosts[1].negatives, 1)
+
+    def test_singleFlight(self):
+        flights = qremis_api.blueprint.SingleFlight()
+        calls = []
+
+        def slow_read(x):
+            calls.append(x)
+            time.sleep(0.2)
+            return x * 2
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do("key", slow_read, 21)))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.stats()['coalesced'], 4)
+        self.assertEqual(flights.stats()['in_flight'], 0)
+        # Nothing in flight, so a later call reads again
+        self.assertEqual(flights.do("key", slow_read, 1), 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_warmUp(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        path = os.path.join(tempfile.mkdtemp(), "summary")
+        qremis_api.blueprint.BLUEPRINT.config['access_summary'] = \
+            qremis_api.blueprint.AccessSummary(path, interval=0)
+        try:
+            agent = make_agent()
+            agent_id = agent.get_agentIdentifier()[0].get_agentIdentifierValue()
+            self.response_200_json(
+                self.app.post("/agent_list", data={"record": json.dumps(agent.to_dict())})
+            )
+            self.response_200_json(self.app.get("/agent_list/{}".format(agent_id)))
+            self.assertEqual(qremis_api.blueprint.AccessSummary.load(path), [("agent", agent_id, 1)])
+            # Reads of unknown identifiers aren't counted, and older counts decay
+            self.assertEqual(self.app.get("/agent_list/{}".format(uuid4().hex)).status_code, 404)
+            for _ in range(4):
+                self.response_200_json(self.app.get("/agent_list/{}/sparse".format(agent_id)))
+            self.assertEqual(qremis_api.blueprint.AccessSummary.load(path), [("agent", agent_id, 1)])
+            cached = qremis_api.blueprint.CachingStorageBackend(storage, record_size=1000000, link_size=1000000)
+            self.assertEqual(qremis_api.blueprint.warm_up(cached, [("agent", agent_id)]), 1)
+            self.assertEqual(cached.get_record(agent_id), storage.get_record(agent_id))
+            self.assertEqual(cached.stats()['record_cache']['hits'], 1)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['access_summary'] = None
+
+    def test_writeCoalescer(self):
+        batches = []
+
+        def flush(writes):
+            if "bad" in writes:
+                raise ValueError()
+            batches.append(list(writes))
+
+        coalescer = qremis_api.blueprint.WriteCoalescer(flush, window=0.2, max_size=100)
+        errors = []
+
+        def write(x):
+            try:
+                coalescer.write([x])
+            except ValueError:
+                errors.append(x)
+
+        threads = [threading.Thread(target=write, args=(x,)) for x in ["a", "b", "bad", "c"]]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # Only the caller with the bad write fails, the rest are redone alone
+        self.assertEqual(errors, ["bad"])
+        self.assertEqual(sorted(x for batch in batches for x in batch), ["a", "b", "c"])
+        self.assertEqual(coalescer.stats()['flushes'], 1)
+        self.assertEqual(coalescer.stats()['largest_batch'], 4)
+        # A full batch is flushed without waiting out the window
+        coalescer = qremis_api.blueprint.WriteCoalescer(flush, window=60, max_size=2)
+        coalescer.write(["d", "e"])
+        self.assertEqual(batches[-1], ["d", "e"])
+
+    def test_coalescedLinkWrites(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        qremis_api.blueprint.BLUEPRINT.config['storage'] = \
+            qremis_api.blueprint.CoalescingStorageBackend(storage, window=0.05)
+        try:
+            rel = make_relationship()
+            rel_id = rel.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+            self.response_200_json(
+                self.app.post("/relationship_list", data={"record": json.dumps(rel.to_dict())})
+            )
+            agent_ids = []
+            for _ in range(5):
+                agent = make_agent()
+                agent_ids.append(agent.get_agentIdentifier()[0].get_agentIdentifierValue())
+                self.response_200_json(
+                    self.app.post("/agent_list", data={"record": json.dumps(agent.to_dict())})
+                )
+            threads = [threading.Thread(target=qremis_api.blueprint.BLUEPRINT.config['storage'].link_records,
+                                        args=("agent", x, "relationship", rel_id))
+                       for x in agent_ids]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(sorted(storage.get_kind_links("agent", rel_id, "0", None)[1]),
+                             sorted(agent_ids))
+            for x in agent_ids:
+                self.assertEqual(storage.get_kind_links("relationship", x, "0", None)[1], [rel_id])
+            stats = qremis_api.blueprint.BLUEPRINT.config['storage'].stats()['link_coalescer']
+            self.assertEqual(stats['writes'], 5)
+            self.assertLess(stats['flushes'], 5)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['storage'] = storage
+
+    def test_asyncIngest(self):
+        # No worker threads, the queue is drained by hand
+        queue = qremis_api.blueprint.IngestQueue(os.path.join(tempfile.mkdtemp(), "ingest.db"), workers=0)
+        qremis_api.blueprint.BLUEPRINT.config['ingest_queue'] = queue
+        try:
+            agent = make_agent()
+            agent_id = agent.get_agentIdentifier()[0].get_agentIdentifierValue()
+            rv = self.app.post("/agent_list", data={"record": json.dumps(agent.to_dict())})
+            self.assertEqual(rv.status_code, 202)
+            rj = json.loads(rv.data.decode())
+            self.assertEqual(rj['id'], agent_id)
+            self.assertEqual(rv.headers['Location'], rj['status'])
+            # The identifier is taken while the record is queued
+            rv = self.app.post("/agent_list", data={"record": json.dumps(agent.to_dict())})
+            self.assertEqual(rv.status_code, 400)
+            status = self.response_200_json(self.app.get(rj['status']))
+            self.assertEqual(status['state'], "queued")
+            self.assertEqual(self.app.get("/agent_list/{}".format(agent_id)).status_code, 404)
+            qremis_api.blueprint.drain_ingest_queue(queue, qremis_api.blueprint.BLUEPRINT.config['storage'])
+            status = self.response_200_json(self.app.get(rj['status']))
+            self.assertEqual(status['state'], "stored")
+            self.response_200_json(self.app.get(status['record']))
+            self.assertEqual(queue.stats()['stored'], 1)
+            self.assertEqual(self.app.get("/ingest_status/999").status_code, 404)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['ingest_queue'] = None
+
+    def test_ingestQueueReclaim(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        queue = qremis_api.blueprint.IngestQueue(os.path.join(tempfile.mkdtemp(), "ingest.db"), lease=0)
+        agent = make_agent()
+        agent_id = agent.get_agentIdentifier()[0].get_agentIdentifierValue()
+        rec = json.dumps({"agentIdentifier": agent.to_dict()["agentIdentifier"]})
+        ticket = queue.put("agent", agent_id, rec, {})
+        # A worker claims the record, adds it, and dies before completing it
+        self.assertEqual(len(queue.claim(10)), 1)
+        storage.add_record("agent", agent_id, rec)
+        self.assertEqual(qremis_api.blueprint.drain_ingest_queue(queue, storage), 1)
+        self.assertEqual(queue.status(ticket)['state'], "stored")
+        # A record which really is a duplicate fails
+        ticket = queue.put("agent", agent_id, rec, {})
+        self.assertEqual(qremis_api.blueprint.drain_ingest_queue(queue, storage), 1)
+        self.assertEqual(queue.status(ticket)['state'], "failed")
+        self.assertEqual(queue.status(ticket)['error']['error_name'], "DuplicateIdentifierError")
+
+    def test_ingestQueuePoisonedRecord(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        queue = qremis_api.blueprint.IngestQueue(os.path.join(tempfile.mkdtemp(), "ingest.db"))
+        event_id = uuid4().hex
+        tickets = {}
+        for _ in range(2):
+            agent = make_agent()
+            agent_id = agent.get_agentIdentifier()[0].get_agentIdentifierValue()
+            rec = json.dumps({"agentIdentifier": agent.to_dict()["agentIdentifier"]})
+            tickets[agent_id] = queue.put("agent", agent_id, rec, {"event": [event_id]})
+        good_id, bad_id = list(tickets)
+
+        class PoisonedStorage(qremis_api.blueprint.StorageBackendWrapper):
+            def link_records_many(self, links):
+                if any(x[1] == bad_id for x in links):
+                    raise RuntimeError("Poisoned")
+                return self.backend.link_records_many(links)
+
+        poisoned = PoisonedStorage(storage)
+        # The bad record fails the batch, but doesn't hold back the good one
+        self.assertEqual(qremis_api.blueprint.drain_ingest_queue(queue, poisoned, max_attempts=2), 2)
+        self.assertEqual(queue.status(tickets[good_id])['state'], "stored")
+        self.assertEqual(queue.status(tickets[bad_id])['state'], "queued")
+        self.assertEqual(storage.get_kind_links("event", good_id, "0", None)[1], [event_id])
+        # Until it runs out of attempts
+        self.assertEqual(qremis_api.blueprint.drain_ingest_queue(queue, poisoned, max_attempts=2), 1)
+        status = queue.status(tickets[bad_id])
+        self.assertEqual(status['state'], "failed")
+        self.assertEqual(status['error']['message'], "Poisoned")
+        self.assertEqual(qremis_api.blueprint.drain_ingest_queue(queue, poisoned, max_attempts=2), 0)
+
+    def test_admissionLimiter(self):
+        limiter = qremis_api.blueprint.AdmissionLimiter(1, queue_size=1, timeout=0.1)
+        self.assertTrue(limiter.acquire())
+        # The queued request times out, as nothing is released
+        self.assertFalse(limiter.acquire())
+        self.assertEqual(limiter.stats()['timed_out'], 1)
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+        waiter.start()
+        time.sleep(0.02)
+        # The queue is full
+        self.assertFalse(limiter.acquire())
+        self.assertEqual(limiter.stats()['rejected'], 1)
+        limiter.release()
+        waiter.join()
+        self.assertEqual(results, [True])
+        limiter.release()
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+    def test_admissionControl(self):
+        limiter = qremis_api.blueprint.AdmissionLimiter(1, queue_size=0)
+        qremis_api.blueprint.BLUEPRINT.config['admission'] = {"reads": limiter}
+        try:
+            rv = self.app.get("/agent_count")
+            self.response_200_json(rv)
+            self.assertTrue(limiter.acquire())
+            rv = self.app.get("/agent_count")
+            self.assertEqual(rv.status_code, 503)
+            self.assertIn("Retry-After", rv.headers)
+            # Other classes of request are unaffected
+            self.response_200_json(self.app.get("/agent_list"))
+            limiter.release()
+            self.response_200_json(self.app.get("/agent_count"))
+            stats = self.response_200_json(self.app.get("/stats"))
+            self.assertEqual(stats['admission']['reads']['rejected'], 1)
+            self.assertEqual(stats['admission']['reads']['in_flight'], 0)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['admission'] = {}
+
+    def test_admissionHeldWhileStreaming(self):
+        relationship = make_relationship()
+        rel_id = relationship.get_relationshipIdentifier()[0].get_relationshipIdentifierValue()
+        obj = make_object()
+        obj_id = obj.get_objectIdentifier()[0].get_objectIdentifierValue()
+        self.response_200_json(
+            self.app.post("/relationship_list", data={"record": json.dumps(relationship.to_dict())})
+        )
+        self.response_200_json(self.app.post("/object_list", data={"record": json.dumps(obj.to_dict())}))
+        self.response_200_json(
+            self.app.post("/relationship_list/{}/linkedObjects".format(rel_id), data={"object_id": obj_id})
+        )
+        limiter = qremis_api.blueprint.AdmissionLimiter(1, queue_size=0)
+        qremis_api.blueprint.BLUEPRINT.config['admission'] = {"hydrations": limiter}
+        qremis_api.blueprint.BLUEPRINT.config['STREAM_THRESHOLD'] = 1
+        try:
+            rv = self.app.get("/relationship_list/{}".format(rel_id), buffered=False)
+            self.assertEqual(rv.status_code, 200)
+            self.assertTrue(rv.is_streamed)
+            # The slot is held until the streamed body has been sent
+            self.assertEqual(self.app.get("/relationship_list/{}".format(rel_id)).status_code, 503)
+            body = json.loads(rv.get_data().decode())
+            rv.close()
+            self.assertIn(obj_id, [x['linkingObjectIdentifierValue'] for x in body['linkingObjectIdentifier']])
+            self.assertEqual(limiter.stats()['in_flight'], 0)
+            self.response_200_json(self.app.get("/relationship_list/{}".format(rel_id)))
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['admission'] = {}
+            qremis_api.blueprint.BLUEPRINT.config['STREAM_THRESHOLD'] = None
+
+    def test_circuitBreaker(self):
+        breaker = qremis_api.blueprint.CircuitBreaker(threshold=2, reset_timeout=0.1)
+        self.assertIsNone(breaker.allow())
+        breaker.failed()
+        self.assertIsNone(breaker.allow())
+        breaker.failed()
+        self.assertEqual(breaker.stats()['state'], "open")
+        self.assertIsNotNone(breaker.allow())
+        time.sleep(0.15)
+        # One trial call is let through once the breaker has been open long enough
+        self.assertIsNone(breaker.allow())
+        self.assertEqual(breaker.stats()['state'], "half_open")
+        self.assertIsNotNone(breaker.allow())
+        breaker.failed()
+        self.assertEqual(breaker.stats()['state'], "open")
+        time.sleep(0.15)
+        self.assertIsNone(breaker.allow())
+        breaker.succeeded()
+        self.assertEqual(breaker.stats()['state'], "closed")
+        self.assertEqual(breaker.stats()['opened'], 2)
+
+    def test_policyStorageBackend(self):
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        breaker = qremis_api.blueprint.CircuitBreaker(threshold=3, reset_timeout=60)
+        policy = qremis_api.blueprint.PolicyStorageBackend(storage, breaker, retries=1, backoff=0.001)
+        calls = []
+
+        def flaky(kind):
+            calls.append(kind)
+            if len(calls) == 1:
+                raise redis.ConnectionError()
+            return storage.count_kind(kind)
+
+        # A read is retried
+        policy.backend = type("Flaky", (), {"count_kind": staticmethod(flaky)})()
+        self.assertEqual(policy.count_kind("agent"), storage.count_kind("agent"))
+        self.assertEqual(len(calls), 2)
+
+        def down(*args):
+            raise redis.TimeoutError()
+
+        # A write isn't
+        policy.backend = type("Down", (), {"add_record": staticmethod(down),
+                                           "count_kind": staticmethod(down)})()
+        with self.assertRaises(qremis_api.blueprint.ServiceUnavailableError):
+            policy.add_record("agent", "id", "{}")
+        with self.assertRaises(qremis_api.blueprint.ServiceUnavailableError):
+            policy.count_kind("agent")
+        self.assertEqual(breaker.stats()['state'], "open")
+        # The open breaker refuses calls without making them
+        policy.backend = storage
+        qremis_api.blueprint.BLUEPRINT.config['storage'] = policy
+        try:
+            rv = self.app.get("/agent_count")
+            self.assertEqual(rv.status_code, 503)
+            self.assertIn("Retry-After", rv.headers)
+            self.assertEqual(breaker.stats()['refused'], 1)
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['storage'] = storage
+
+    def test_warmUpSkipsMalformedLines(self):
+        directory = tempfile.mkdtemp()
+        ids = os.path.join(directory, "ids")
+        summary = os.path.join(directory, "summary")
+        with open(ids, "w") as f:
+            f.write("agent a1\nnot a valid line\n\nagent\nbogus b1\nobject o1\n")
+        with open(summary, "w") as f:
+            f.write(json.dumps([["event", "e1", 3], ["event"], "x", ["event", "e2", 1]]))
+        qremis_api.blueprint.BLUEPRINT.config['WARM_UP_IDS'] = ids
+        qremis_api.blueprint.BLUEPRINT.config['ACCESS_SUMMARY_PATH'] = summary
+        try:
+            self.assertEqual(qremis_api.blueprint.warm_up_records(),
+                             [("agent", "a1"), ("object", "o1"), ("event", "e1"), ("event", "e2")])
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['WARM_UP_IDS'] = None
+            qremis_api.blueprint.BLUEPRINT.config['ACCESS_SUMMARY_PATH'] = None
+
+    @unittest.skipIf(asgiref is None, "asgiref is not installed")
+    def test_asgiFallsBackForFlaskOnlyFeatures(self):
+        import qremis_api.asgi
+        storage = qremis_api.blueprint.BLUEPRINT.config['storage']
+        asgi_app = qremis_api.asgi.QremisASGI(qremis_api.app)
+        scope = {"type": "http", "method": "GET", "headers": [], "path": "/agent_list/{}".format(uuid4().hex)}
+        # The Flask app doesn't serve the stored JSON as is
+        self.assertIsNone(asgi_app.route(scope))
+        qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = True
+        try:
+            self.assertIsNotNone(asgi_app.route(scope))
+            for key in ["ACCESS_SUMMARY_PATH", "CONDITIONAL_GETS", "COMPRESSION"]:
+                qremis_api.blueprint.BLUEPRINT.config[key] = "1"
+                try:
+                    self.assertIsNone(asgi_app.route(scope))
+                finally:
+                    qremis_api.blueprint.BLUEPRINT.config[key] = None
+            for wrapped in [
+                qremis_api.blueprint.CachingStorageBackend(storage, record_size=1000),
+                qremis_api.blueprint.BloomFilterStorageBackend(storage, qremis_api.blueprint.BloomFilter(None, 1000)),
+                qremis_api.blueprint.SingleFlightStorageBackend(storage)
+            ]:
+                qremis_api.blueprint.BLUEPRINT.config['storage'] = wrapped
+                try:
+                    self.assertIsNone(asgi_app.route(scope))
+                finally:
+                    qremis_api.blueprint.BLUEPRINT.config['storage'] = storage
+        finally:
+            qremis_api.blueprint.BLUEPRINT.config['SPLICE_LINKS'] = False
+
     def test_version(self):
         rv = self.app.get("/version")
         rj = self.response_200_json(rv)
@@ -1298,6 +2416,7 @@ class RedisTests(TestsMixin, unittest.TestCase):
         qremis_api.blueprint.BLUEPRINT.config['REDIS_HOST'] = 'localhost'
         qremis_api.blueprint.BLUEPRINT.config['REDIS_PORT'] = 6379
         qremis_api.blueprint.BLUEPRINT.config['db'] = 0
+        qremis_api.blueprint.BLUEPRINT.config['STORAGE_BACKEND'] = 'redis'
         qremis_api.blueprint.BLUEPRINT.config['storage'] = qremis_api.blueprint.RedisStorageBackend(
             qremis_api.blueprint.BLUEPRINT
         )
@@ -1312,6 +2431,7 @@ class MongoTests(TestsMixin, unittest.TestCase):
         qremis_api.blueprint.BLUEPRINT.config['MONGO_HOST'] = "localhost"
         qremis_api.blueprint.BLUEPRINT.config['MONGO_PORT'] = 27017
         qremis_api.blueprint.BLUEPRINT.config['MONGO_DBNAME'] = "testing"
+        qremis_api.blueprint.BLUEPRINT.config['STORAGE_BACKEND'] = 'mongo'
         qremis_api.blueprint.BLUEPRINT.config['storage'] = \
             qremis_api.blueprint.MongoStorageBackend(qremis_api.blueprint.BLUEPRINT)
 